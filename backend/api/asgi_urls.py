@@ -0,0 +1,17 @@
+from django.urls import path
+
+from api import async_views
+from api.urls import urlpatterns as sync_urlpatterns
+
+app_name = 'api'
+
+# Справочники в ASGI-приложении отвечают async-представлениями,
+# остальные маршруты те же, что и в WSGI-приложении.
+urlpatterns = [
+    path('tags/', async_views.tag_list, name='tags-list'),
+    path('tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+    path('ingredients/', async_views.ingredient_list,
+         name='ingredients-list'),
+    path('ingredients/<int:pk>/', async_views.ingredient_detail,
+         name='ingredients-detail'),
+] + sync_urlpatterns
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import NotFound
+
+from api.middleware import database_sync_to_async
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.catalog import catalog_lookup, get_catalog_data
+from recipes.models import Ingredient, Tag
+from recipes.search import ingredient_index
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def get_list(model, serializer_class):
+    return serializer_class(model.objects.all(), many=True).data
+
+
+def get_detail(model, serializer_class, pk):
+    obj = model.objects.filter(pk=pk).first()
+    return None if obj is None else serializer_class(obj).data
+
+
+async def catalog_response(request, basename, get_data, *args,
+                           use_cache=True):
+    """Ответ справочника с кэшированием по версии и условными запросами.
+
+    Версия, кэш и данные читаются через database_sync_to_async: кэш может
+    храниться в базе, а файловый кэш блокировал бы цикл событий.
+    """
+    if request.method not in SAFE_METHODS:
+        return HttpResponseNotAllowed(SAFE_METHODS)
+    etag, modified, key = await database_sync_to_async(catalog_lookup)(
+        basename, 'json', *args
+    )
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=modified
+    )
+    if not_modified is not None:
+        return not_modified
+    data = await database_sync_to_async(get_catalog_data)(
+        key, get_data, use_cache
+    )
+    if data is None:
+        return JsonResponse({'detail': NotFound.default_detail}, status=404)
+    response = JsonResponse(
+        data, safe=False, json_dumps_params={'ensure_ascii': False}
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
+
+
+async def tag_list(request):
+    """Получение списка тегов."""
+    return await catalog_response(
+        request, 'tags', lambda: get_list(Tag, TagSerializer), 'list'
+    )
+
+
+async def tag_detail(request, pk):
+    """Получение конкретного тега."""
+    return await catalog_response(
+        request, 'tags', lambda: get_detail(Tag, TagSerializer, pk),
+        'detail', pk
+    )
+
+
+async def ingredient_list(request):
+    """Список ингредиентов или поиск по индексу в памяти."""
+    name = request.GET.get(settings.REST_FRAMEWORK['SEARCH_PARAM'])
+    if not name:
+        return await catalog_response(
+            request, 'ingredients',
+            lambda: get_list(Ingredient, IngredientSerializer), 'list'
+        )
+    return await catalog_response(
+        request, 'ingredients',
+        lambda: ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        ),
+        'search', use_cache=False
+    )
+
+
+async def ingredient_detail(request, pk):
+    """Получение конкретного ингредиента."""
+    return await catalog_response(
+        request, 'ingredients',
+        lambda: get_detail(Ingredient, IngredientSerializer, pk),
+        'detail', pk
+    )
@@ -0,0 +1,51 @@
+import csv
+import json
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def export_txt(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f"{ingredient['ingredient__name']}  - "
+            f"{ingredient['amount']}"
+            f"({ingredient['ingredient__measurement_unit']})\n"
+        )
+
+
+def export_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def export_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]\n' if separator == '[' else ']\n'
+
+
+# формат: (генератор строк, content type, расширение файла)
+SHOPPING_LIST_FORMATS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8', 'txt'),
+    'csv': (export_csv, 'text/csv; charset=utf-8', 'csv'),
+    'json': (export_json, 'application/json', 'json'),
+}
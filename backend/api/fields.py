@@ -1,13 +1,221 @@
 import base64
+import binascii
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from PIL import Image
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+# Кратно 4, чтобы каждая часть base64 декодировалась независимо.
+BASE64_CHUNK_SIZE = 64 * 1024
+# Пробелы и переводы строк ASCII: base64 в формате MIME переносится
+# по 76 символов, и части иначе сдвигаются относительно групп по 4.
+BASE64_WHITESPACE = str.maketrans('', '', ' \t\n\r\v\f')
+
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a'
+)
+
+
+def is_image_header(head):
+    """Проверка сигнатуры JPEG, PNG, GIF или WebP в начале файла."""
+    return head.startswith(IMAGE_SIGNATURES) or (
+        head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    )
 
 
 class Base64ImageFieldSerializer(serializers.ImageField):
+    """Изображение в формате data URI.
+
+    Данные декодируются частями: в памяти, а после
+    FILE_UPLOAD_MAX_MEMORY_SIZE во временном файле, как при обычной
+    загрузке файлов. Размер проверяется до декодирования, сигнатура
+    и размеры в пикселях - по первой части.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': (
+            'Изображение больше {max_dimension} пикселей по стороне '
+            'или {max_pixels} пикселей всего.'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start == -1:
+            self.fail('invalid_base64')
+        ext = data[:start].split('/')[-1]
+        name, content_type = 'temp.' + ext, 'image/' + ext
+        data = data[start + len(';base64,'):].translate(BASE64_WHITESPACE)
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if len(data) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+
+        buffer, upload, size, checked = BytesIO(), None, 0, False
+        for position in range(0, len(data), BASE64_CHUNK_SIZE):
+            try:
+                chunk = base64.b64decode(
+                    data[position:position + BASE64_CHUNK_SIZE], validate=True
+                )
+            except (binascii.Error, ValueError):
+                self.fail('invalid_base64')
+            if not size:
+                if not is_image_header(chunk):
+                    self.fail('invalid_image')
+                checked = self.check_dimensions(BytesIO(chunk))
+            size += len(chunk)
+            if upload is None and size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                upload = TemporaryUploadedFile(name, content_type, 0, None)
+                upload.write(buffer.getvalue())
+                buffer = None
+            (buffer if upload is None else upload).write(chunk)
+        if not size:
+            self.fail('invalid_image')
+
+        if upload is None:
+            upload = InMemoryUploadedFile(
+                buffer, None, name, content_type, size, None
+            )
+        upload.size = size
+        upload.seek(0)
+        if not checked:
+            self.check_dimensions(upload, required=True)
+            upload.seek(0)
+        return upload
+
+    def check_dimensions(self, file, required=False):
+        """Проверка размеров в пикселях по заголовку изображения.
+
+        Возвращает False, если заголовок не поместился в начало файла.
+        """
+        max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = max_dimension + 1
+        except (OSError, SyntaxError):
+            if required:
+                self.fail('invalid_image')
+            return False
+        if max(width, height) > max_dimension or width * height > max_pixels:
+            self.fail(
+                'too_many_pixels',
+                max_dimension=max_dimension, max_pixels=max_pixels
+            )
+        return True
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичный ключ, который для списка разрешается одним запросом IN."""
+
+    default_error_messages = {
+        'does_not_exist_many': (
+            'Недопустимые первичные ключи {pk_values} - объекты не существуют.'
+        ),
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def resolve(self, values):
+        """Объекты для всех ключей из списка одним запросом."""
+        pks = []
+        for data in values:
+            try:
+                pks.append(self.to_pk(data))
+            except (DjangoValidationError, TypeError, ValueError):
+                continue
+        self._resolved = self.get_queryset().in_bulk(set(pks))
+        missing = sorted(
+            {pk for pk in pks if pk not in self._resolved}, key=str
+        )
+        if missing:
+            self.fail('does_not_exist_many', pk_values=missing)
+
+    def to_internal_value(self, data):
+        resolved = getattr(self, '_resolved', None)
+        if resolved is not None:
+            try:
+                return resolved[self.to_pk(data)]
+            except (DjangoValidationError, KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, проверяемый одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        self.child_relation.resolve(data)
+        return [
+            self.child_relation.to_internal_value(item) for item in data
+        ]
+
+
+class BatchedListSerializer(serializers.ListSerializer):
+    """Список вложенных объектов, в котором ключи полей
+    BatchedPrimaryKeyRelatedField проверяются одним запросом на поле.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for field in self.child.fields.values():
+                if isinstance(field, BatchedPrimaryKeyRelatedField):
+                    field.resolve([
+                        item[field.field_name] for item in data
+                        if isinstance(item, dict) and field.field_name in item
+                    ])
+        return super().to_internal_value(data)
+
+
+class RenditionImageField(Base64ImageFieldSerializer):
+    """Изображение, которое отдаётся уменьшенной копией нужного размера.
+
+    Пока копии нет, отдаётся ссылка на оригинал.
+    """
+
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        renditions = getattr(
+            value.instance, f'{value.field.name}_renditions', None
+        ) or {}
+        name = renditions.get(self.rendition)
+        if name is None:
+            return super().to_representation(value)
+        url = value.storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
@@ -11,25 +13,51 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags'
     )
+    search = filters.CharFilter(method='filter_search')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_in_shopping_list'
     )
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, каждый рецепт один раз."""
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию с ранжированием.
+
+        По рангу сортируется только список без собственного порядка:
+        рейтинг остаётся упорядочен по популярности, а курсорная
+        пагинация задаёт порядок сама.
+        """
+        queryset = search_recipes(queryset, value)
+        if queryset.query.order_by:
+            return queryset
+        return queryset.order_by('-search_rank', *Recipe._meta.ordering)
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user_id=user.id)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_in_shopping_list(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_recipe__user_id=user.id)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        # Фильтры применяются в этом порядке. Поиск идёт последним:
+        # индекс в памяти ограничивает выдачу уже отфильтрованных рецептов.
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
@@ -0,0 +1,154 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger('api.queries')
+
+current_stats = ContextVar('query_stats', default=None)
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class QueryStats:
+    """Счётчик SQL-запросов, выполненных за время запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.rows_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            self.rows_written += max(context['cursor'].rowcount, 0)
+        return result
+
+    @property
+    def duplicates(self):
+        """Повторы одного и того же SQL в рамках запроса."""
+        return {
+            sql: count for sql, count in self.statements.items() if count > 1
+        }
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+
+def count_queries(func):
+    """Синхронная функция, запросы которой попадают в статистику запроса.
+
+    Обёртка соединения действует только в своём потоке, поэтому её
+    нужно ставить там, где выполняется код, а не в async-middleware.
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        stats = current_stats.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        with connection.execute_wrapper(stats):
+            return func(*args, **kwargs)
+    return inner
+
+
+def database_sync_to_async(func):
+    """Обёртка синхронного кода с запросами к базе для async-представлений.
+
+    Django 3.2 выполняет весь thread_sensitive-код процесса в одном потоке,
+    поэтому функция запускается в общем пуле потоков. Соединение
+    закрывается по тем же правилам, что и в конце обычного запроса,
+    а запросы попадают в статистику текущего запроса.
+    """
+    counted = count_queries(func)
+
+    def inner(*args, **kwargs):
+        try:
+            return counted(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(inner, thread_sensitive=False)
+
+
+def get_view_name(view_func, method):
+    """Имя представления и действия DRF для обработчика."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryStatsMiddleware:
+    """Учёт количества и времени SQL-запросов по представлениям."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django узнаёт, что цепочку можно вызывать асинхронно.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        view_name = getattr(request, 'query_stats_view', '')
+        db_time = round(stats.duration * 1000, 2)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view_name,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_time_ms': db_time,
+                'rows_written': stats.rows_written,
+                'duplicates': stats.duplicate_count,
+                'duplicate_sql': list(stats.duplicates),
+            }, ensure_ascii=False))
+        if settings.QUERY_STATS_HEADERS:
+            response['X-Query-Count'] = stats.count
+            response['X-DB-Time-Ms'] = db_time
+            response['X-DB-Rows-Written'] = stats.rows_written
+            response['X-Duplicate-Queries'] = stats.duplicate_count
+            response['X-View-Name'] = view_name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_stats_view = get_view_name(view_func, request.method)
@@ -1,7 +1,54 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.conf import settings
 
 
 class LimitPagination(PageNumberPagination):
     page_size = settings.PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов по (pub_date, id)."""
+
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class PopularCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация рейтинга рецептов по (popularity, id)."""
+
+    ordering = ('-popularity', '-id')
+
+
+class RecipePagination(LimitPagination):
+    """Постраничная пагинация с курсорным режимом по запросу.
+
+    Курсорный режим включается параметром ?paginate=cursor или
+    наличием параметра cursor из ссылок next/previous.
+    """
+
+    cursor_class = RecipeCursorPagination
+
+    def __init__(self):
+        self.cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.cursor_class.cursor_query_param in request.query_params
+            or request.query_params.get('paginate') == 'cursor'
+        ):
+            self.cursor_pagination = self.cursor_class()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class PopularPagination(RecipePagination):
+    cursor_class = PopularCursorPagination
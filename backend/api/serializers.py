@@ -1,13 +1,18 @@
 from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Value, prefetch_related_objects)
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from djoser.serializers import UserSerializer
 from rest_framework import exceptions, serializers
 
-from api.fields import Base64ImageFieldSerializer
+from api.fields import (Base64ImageFieldSerializer, BatchedListSerializer,
+                        BatchedPrimaryKeyRelatedField, RenditionImageField)
 from users.models import Follow
 from recipes.models import (Favourites, Ingredient, Recipe,
-                            Tag, IngredientRecipe, ShoppingList)
+                            ShoppingCartIngredient, Tag, IngredientRecipe,
+                            ShoppingList, TimelineEntry, change_counter)
+from recipes.renditions import schedule
 
 
 User = get_user_model()
@@ -27,11 +32,22 @@ class UserAvatarSerializer(UserSerializer):
             raise serializers.ValidationError('Поле avatar обязательно!')
         return data
 
+    def update(self, instance, validated_data):
+        if 'avatar' in validated_data:
+            instance.avatar_renditions = {}
+        instance = super().update(instance, validated_data)
+        if validated_data.get('avatar'):
+            schedule(instance)
+        return instance
+
 
 class FoodgramUserSerializer(UserAvatarSerializer):
     """Получение списка пользователей и конкретного пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar = RenditionImageField(
+        'small', required=False, allow_null=True
+    )
 
     class Meta:
         model = User
@@ -47,6 +63,8 @@ class FoodgramUserSerializer(UserAvatarSerializer):
 
     def get_is_subscribed(self, obj):
         """Проверка подписки пользователя"""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (
             request
@@ -78,14 +96,18 @@ class FollowCreateSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
-        return FollowSerializer(instance.author, context=self.context).data
+        request = self.context.get('request')
+        author = FollowSerializer.get_authors(
+            User.objects.filter(pk=instance.author_id), request.user
+        ).get()
+        FollowSerializer.prefetch_recipes((author,), request)
+        return FollowSerializer(author, context=self.context).data
 
 
 class FollowSerializer(FoodgramUserSerializer):
     """Подписки."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -101,16 +123,35 @@ class FollowSerializer(FoodgramUserSerializer):
             'recipes_count'
         )
 
-    def get_recipes(self, obj):
-        request = self.context.get('request')
+    @staticmethod
+    def get_authors(queryset, user):
+        """Авторы с отметкой подписки, число рецептов хранится в модели."""
+        if not user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(
+                False, output_field=BooleanField()
+            ))
+        return queryset.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')
+            )),
+        )
+
+    @staticmethod
+    def prefetch_recipes(authors, request):
+        """Загрузка рецептов всех авторов страницы одним запросом."""
+        if not authors:
+            return
         limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj)
+        queryset = Recipe.objects.all()
         if limit:
-            queryset = queryset[:int(limit)]
-        return ShortRecipeSerializer(queryset, many=True).data
+            queryset = Recipe.objects.limited_per_author(authors, int(limit))
+        prefetch_related_objects(
+            authors,
+            Prefetch('recipes', queryset=queryset, to_attr='limited_recipes')
+        )
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+    def get_recipes(self, obj):
+        return ShortRecipeSerializer(obj.limited_recipes, many=True).data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -146,7 +187,7 @@ class IngredientsRecipeSerializer(serializers.ModelSerializer):
 class CreateIngredientsInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор создания ингредиента в создании рецепта."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BatchedPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         write_only=True
     )
@@ -154,13 +195,14 @@ class CreateIngredientsInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientRecipe
         fields = ('id', 'amount',)
+        list_serializer_class = BatchedListSerializer
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов"""
 
     ingredients = CreateIngredientsInRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BatchedPrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all()
     )
     image = Base64ImageFieldSerializer(use_url=True)
@@ -178,10 +220,11 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         """Метод представления модели"""
+        request = self.context.get('request')
         serializer = ReadRecipeSerializer(
-            instance,
+            Recipe.objects.for_read(request.user).get(pk=instance.pk),
             context={
-                'request': self.context.get('request')
+                'request': request
             }
         )
         return serializer.data
@@ -236,19 +279,62 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(
             author=request.user, **validated_data
         )
+        change_counter(
+            User.objects.filter(pk=request.user.pk), 'recipes_count', 1
+        )
 
         self.__create_ingredients(ingredients, recipe)
         self.__create_tags(tags, recipe)
+        TimelineEntry.objects.add_recipe(recipe)
+        schedule(recipe)
         return recipe
 
+    def __update_ingredients(self, ingredients, recipe):
+        """Метод изменения только отличающихся ингредиентов рецепта"""
+        current = {
+            row.ingredient_id: row for row in recipe.ingredient_list.all()
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()
+        }
+        new_amounts = {
+            element['id'].id: element['amount'] for element in ingredients
+        }
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            recipe.ingredient_list.filter(ingredient_id__in=removed).delete()
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                ingredient_id=ingredient_id, recipe=recipe, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        )
+        changed = []
+        for ingredient_id, row in current.items():
+            if ingredient_id in new_amounts and (
+                row.amount != new_amounts[ingredient_id]
+            ):
+                row.amount = new_amounts[ingredient_id]
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        if old_amounts != new_amounts:
+            ShoppingCartIngredient.objects.change_recipe(
+                recipe, old_amounts, new_amounts
+            )
+        if old_amounts.keys() != new_amounts.keys():
+            # Похожие рецепты пересчитает команда similar.
+            recipe.similar_refreshed_at = None
+
     @transaction.atomic
     def update(self, instance, validated_data):
         """Метод обновления модели"""
-        instance.tags.clear()
-        instance.ingredients.clear()
-
-        self.__create_ingredients(validated_data.pop('ingredients'), instance)
+        self.__update_ingredients(validated_data.pop('ingredients'), instance)
         self.__create_tags(validated_data.pop('tags'), instance)
+        if 'image' in validated_data:
+            instance.image_renditions = {}
+            schedule(instance)
 
         return super().update(instance, validated_data)
 
@@ -256,6 +342,8 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Дополнительный сериализатор для рецептов """
 
+    image = RenditionImageField('thumb', read_only=True)
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -271,6 +359,7 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
                                               read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = RenditionImageField('card', read_only=True)
 
     class Meta:
         model = Recipe
@@ -287,8 +376,16 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def to_representation(self, instance):
+        """Передача отметки подписки во вложенного автора."""
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
         """Проверка наличия рецепта в избранном."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
             request
@@ -300,6 +397,8 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка наличия рецепта в списке покупок."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request
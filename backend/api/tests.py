@@ -0,0 +1,357 @@
+import base64
+import os
+import tempfile
+from io import BytesIO
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.fields import BASE64_CHUNK_SIZE, Base64ImageFieldSerializer
+
+from foodgram.asgi import application
+
+from recipes.management.commands.querybudget import (
+    BUDGETS, SAMPLE_SIZES, measure_queries, missing_budgets
+)
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.sample_data import SAMPLE_IMAGE, create_sample_data
+
+User = get_user_model()
+
+
+class RecipeTagFilterTests(TestCase):
+    """Фильтр рецептов по нескольким тегам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия', password='password'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.recipes = {}
+        for name, tag_numbers in (
+            ('breakfast', (0, 1)),
+            ('lunch', (0,)),
+            ('dinner', (2,)),
+            ('all', (0, 1, 2)),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Описание',
+                cooking_time=1, image=SAMPLE_IMAGE
+            )
+            recipe.tags.set(cls.tags[number] for number in tag_numbers)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+            cls.recipes[name] = recipe
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_list(self, params):
+        response = self.client.get(
+            reverse('api:recipes-list'), {'limit': 10, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_recipe_with_several_selected_tags_returned_once(self):
+        data = self.get_list({'tags': ['tag0', 'tag1', 'tag2']})
+        ids = [recipe['id'] for recipe in data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertCountEqual(
+            ids, [recipe.id for recipe in self.recipes.values()]
+        )
+        self.assertEqual(data['count'], len(ids))
+
+    def test_only_recipes_with_selected_tags(self):
+        data = self.get_list({'tags': ['tag0', 'tag1']})
+        self.assertCountEqual(
+            [recipe['id'] for recipe in data['results']],
+            [self.recipes[name].id for name in ('breakfast', 'lunch', 'all')]
+        )
+        self.assertEqual(data['count'], 3)
+
+    def test_without_tags_all_recipes(self):
+        data = self.get_list({})
+        self.assertEqual(data['count'], len(self.recipes))
+        self.assertEqual(len(data['results']), len(self.recipes))
+
+    def test_detail_without_tags(self):
+        recipe = self.recipes['dinner']
+        response = self.client.get(
+            reverse('api:recipes-detail', kwargs={'pk': recipe.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], recipe.pk)
+
+
+class RecipeSearchOrderingTests(TestCase):
+    """Порядок выдачи поиска в списке, рейтинге и курсорном режиме."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия', password='password'
+        )
+        # Борщ в названии ранжируется выше, но суп популярнее и новее.
+        cls.borscht = Recipe.objects.create(
+            author=author, name='Борщ', text='Свёкла и капуста',
+            cooking_time=1, image=SAMPLE_IMAGE, popularity=1
+        )
+        cls.soup = Recipe.objects.create(
+            author=author, name='Суп', text='Почти борщ',
+            cooking_time=1, image=SAMPLE_IMAGE, popularity=10
+        )
+
+    def setUp(self):
+        # Индекс строится заново по данным этого теста.
+        cache.clear()
+        self.client = APIClient()
+
+    def get_ids(self, url_name, params):
+        response = self.client.get(
+            reverse(url_name), {'limit': 10, 'search': 'борщ', **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_list_ordered_by_rank(self):
+        self.assertEqual(
+            self.get_ids('api:recipes-list', {}),
+            [self.borscht.id, self.soup.id]
+        )
+
+    def test_popular_ordered_by_popularity(self):
+        self.assertEqual(
+            self.get_ids('api:recipes-popular', {}),
+            [self.soup.id, self.borscht.id]
+        )
+
+    def test_cursor_ordered_by_pub_date(self):
+        self.assertEqual(
+            self.get_ids('api:recipes-list', {'paginate': 'cursor'}),
+            [self.soup.id, self.borscht.id]
+        )
+
+
+@override_settings(RECIPE_SEARCH_FALLBACK_LIMIT=1)
+class RecipeSearchFilterTests(TestCase):
+    """Лимит поиска в памяти применяется к уже отфильтрованным рецептам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, other = (
+            User.objects.create_user(
+                email=f'{username}@foodgram.ru', username=username,
+                first_name='Имя', last_name='Фамилия', password='password'
+            )
+            for username in ('cook', 'other')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+        # Рецепт другого автора ранжируется выше и новее.
+        Recipe.objects.create(
+            author=other, name='Суп', text='Суп дня',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+
+    def setUp(self):
+        # Индекс строится заново по данным этого теста.
+        cache.clear()
+        self.client = APIClient()
+
+    def test_search_with_author_filter(self):
+        response = self.client.get(
+            reverse('api:recipes-list'),
+            {'search': 'суп', 'author': self.author.pk}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['id'], self.recipe.pk)
+
+
+class CatalogCacheTests(TestCase):
+    """Кэш ответов справочников по версии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_query_string_served_from_same_entry(self):
+        url = reverse('api:tags-list')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'x': 'random'})
+        self.assertEqual(response.data[0]['slug'], self.tag.slug)
+
+    def test_detail_cached_per_object(self):
+        url = reverse('api:tags-detail', kwargs={'pk': self.tag.pk})
+        self.assertEqual(self.client.get(url).data['slug'], self.tag.slug)
+        with self.assertNumQueries(0):
+            self.client.get(url, {'x': 'random'})
+        missing = reverse('api:tags-detail', kwargs={'pk': self.tag.pk + 1})
+        response = self.client.get(missing)
+        self.assertEqual(response.status_code, 404)
+
+
+class Base64ImageFieldTests(TestCase):
+    """Декодирование изображений из data URI частями."""
+
+    def test_line_wrapped_base64(self):
+        # Шум почти не сжимается: файл длиннее одной части base64.
+        buffer = BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(
+            buffer, 'PNG'
+        )
+        content = buffer.getvalue()
+        self.assertGreater(len(content), BASE64_CHUNK_SIZE)
+        # encodebytes переносит строки по 76 символов, как MIME.
+        data = 'data:image/png;base64,' + base64.encodebytes(
+            content
+        ).decode()
+        upload = Base64ImageFieldSerializer().to_internal_value(data)
+        self.assertEqual(upload.read(), content)
+
+
+class QueryBudgetTests(TestCase):
+    """Бюджет SQL-запросов маршрутов api из команды querybudget."""
+
+    def test_all_routes_have_budget(self):
+        self.assertEqual(missing_budgets(), [])
+
+    def test_budgets_on_both_sample_sizes(self):
+        counts = []
+        for sizes in SAMPLE_SIZES:
+            # Справочники и индекс поиска читаются заново на каждой выборке.
+            cache.clear()
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root), \
+                    transaction.atomic():
+                results = measure_queries(create_sample_data(**sizes))
+                transaction.set_rollback(True)
+            for entry, (url, label, status_code, queries) in zip(
+                BUDGETS, results
+            ):
+                _, method, _, _, auth, budget = entry
+                with self.subTest(
+                    sizes=sizes, method=method, url=url, params=label,
+                    auth=auth
+                ):
+                    self.assertLess(status_code, 400)
+                    self.assertLessEqual(queries, budget)
+            counts.append([queries for *_, queries in results])
+        for entry, *entry_counts in zip(BUDGETS, *counts):
+            name, method, _, params, auth, _ = entry
+            with self.subTest(
+                name=name, method=method, params=params, auth=auth
+            ):
+                # Разное число запросов на выборках означает N+1.
+                self.assertEqual(len(set(entry_counts)), 1, entry_counts)
+
+
+def asgi_get(path, headers=()):
+    """GET-запрос к ASGI-приложению: статус, заголовки и тело ответа."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async_to_sync(application)(scope, receive, send)
+    start, *body = messages
+    return start['status'], {
+        name.decode().lower(): value.decode()
+        for name, value in start['headers']
+    }, b''.join(message.get('body', b'') for message in body)
+
+
+# Async-представления читают базу в других потоках, поэтому данные
+# должны быть сохранены, а не оставаться в транзакции теста.
+@override_settings(QUERY_STATS_HEADERS=True)
+class AsgiApplicationTests(TransactionTestCase):
+    """Справочники и рецепты в ASGI-приложении."""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='asgi@foodgram.ru', username='asgi',
+            first_name='Имя', last_name='Фамилия', password='password'
+        )
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        recipe = Recipe.objects.create(
+            author=author, name='Омлет', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+        recipe.tags.set((self.tag,))
+
+    def test_tags_from_async_view_with_conditional_get(self):
+        status, headers, _ = asgi_get('/api/tags/')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['x-view-name'], 'api.async_views.tag_list')
+        status, _, _ = asgi_get(
+            '/api/tags/', ((b'if-none-match', headers['etag'].encode()),)
+        )
+        self.assertEqual(status, 304)
+
+    def test_tag_detail_not_found(self):
+        status, _, _ = asgi_get(f'/api/tags/{self.tag.pk + 100}/')
+        self.assertEqual(status, 404)
+
+    def test_tags_with_database_cache(self):
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'foodgram_cache',
+        }}
+        with override_settings(CACHES=caches):
+            call_command('createcachetable', verbosity=0)
+            for _ in range(2):
+                status, _, body = asgi_get(f'/api/tags/{self.tag.pk}/')
+                self.assertEqual(status, 200)
+                self.assertIn(self.tag.slug.encode(), body)
+
+    def test_sync_view_queries_counted(self):
+        status, headers, _ = asgi_get('/api/recipes/')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['x-view-name'], 'RecipeViewSet.list')
+        self.assertEqual(
+            int(headers['x-query-count']),
+            int(APIClient().get(reverse('api:recipes-list'))['X-Query-Count'])
+        )
+        self.assertGreater(int(headers['x-query-count']), 0)
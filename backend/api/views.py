@@ -1,25 +1,32 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
-from rest_framework.filters import SearchFilter
 from rest_framework.decorators import action
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
+from api.exporters import EXPORT_CHUNK_SIZE, SHOPPING_LIST_FORMATS
 from api.filters import RecipeFilter
 from api.serializers import (FavouritesSerializer, FollowCreateSerializer,
                              IngredientSerializer, FollowSerializer,
                              ReadRecipeSerializer, ShoppingListSerializer,
                              TagSerializer, CreateRecipeSerializer,
-                             UserAvatarSerializer)
+                             ShortRecipeSerializer, UserAvatarSerializer)
+from api.pagination import PopularPagination, RecipePagination
 from api.permissions import IsAuthorOrReadOnlyPermission
-from recipes.models import (IngredientRecipe, Tag, Ingredient, Favourites,
-                            Recipe, ShoppingList)
+from recipes.catalog import catalog_lookup, get_catalog_data
+from recipes.models import (Tag, Ingredient, Favourites, Recipe,
+                            ShoppingCartIngredient, ShoppingList,
+                            TimelineEntry, change_counter)
+from recipes.search import ingredient_index
 from users.models import Follow
 
 User = get_user_model()
@@ -30,6 +37,12 @@ class FoodgramUserViewSet(UserViewSet):
 
     pagination_class = LimitOffsetPagination
 
+    def get_queryset(self):
+        """Пользователи с отметкой подписки одним запросом."""
+        return FollowSerializer.get_authors(
+            super().get_queryset(), self.request.user
+        )
+
     def get_permissions(self):
         if self.action == 'me':
             return (IsAuthenticated(),)
@@ -54,6 +67,7 @@ class FoodgramUserViewSet(UserViewSet):
             )
 
         self.request.user.avatar = None
+        self.request.user.avatar_renditions = {}
         self.request.user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -63,8 +77,11 @@ class FoodgramUserViewSet(UserViewSet):
             url_name='subscriptions')
     def subscriptions(self, request):
         """Просмотр подписок пользователя."""
-        queryset = User.objects.filter(follower__user=request.user)
+        queryset = FollowSerializer.get_authors(
+            User.objects.filter(publisher__user=request.user), request.user
+        )
         pages = self.paginate_queryset(queryset)
+        FollowSerializer.prefetch_recipes(pages, request)
         serializer = FollowSerializer(
             pages,
             many=True,
@@ -75,6 +92,7 @@ class FoodgramUserViewSet(UserViewSet):
     @action(detail=True,
             methods=('POST', 'DELETE',),
             permission_classes=(IsAuthenticated,))
+    @transaction.atomic
     def subscribe(self, request, id=None):
         """Подписка на автора."""
         user = request.user
@@ -87,6 +105,7 @@ class FoodgramUserViewSet(UserViewSet):
                 context={'request': request, 'user': user})
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            TimelineEntry.objects.follow(user, author)
             return Response(
                 data=serializer.data, status=status.HTTP_201_CREATED
             )
@@ -96,10 +115,46 @@ class FoodgramUserViewSet(UserViewSet):
         if delete_count == 0:
             return Response({'errors': 'Вы уже отписались!'},
                             status=status.HTTP_400_BAD_REQUEST)
+        TimelineEntry.objects.unfollow(user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class FoodgramReadOnlyModelViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogCacheMixin:
+    """Кэширование справочников по их версии и условные GET-запросы."""
+
+    def catalog_response(self, request, get_data, *args, use_cache=True):
+        """Ответ из кэша по версии справочников; args дополняют ключ."""
+        etag, modified, key = catalog_lookup(
+            self.basename, request.accepted_renderer.format, *args
+        )
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=modified
+        )
+        if not_modified is not None:
+            return not_modified
+        response = Response(get_catalog_data(key, get_data, use_cache))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs
+            ).data, 'list'
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            ).data, 'detail',
+            kwargs[self.lookup_url_kwarg or self.lookup_field]
+        )
+
+
+class FoodgramReadOnlyModelViewSet(CatalogCacheMixin,
+                                   viewsets.ReadOnlyModelViewSet):
     """ReadOnly model viewset with presets."""
 
     permission_classes = (AllowAny,)
@@ -119,8 +174,21 @@ class IngredientViewSet(FoodgramReadOnlyModelViewSet):
     permission_classes = (IsAuthorOrReadOnlyPermission,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (SearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по индексу в памяти без обращения к базе."""
+        name = request.query_params.get(
+            settings.REST_FRAMEWORK['SEARCH_PARAM']
+        )
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.catalog_response(
+            request,
+            lambda: ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ),
+            'search', use_cache=False
+        )
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -129,6 +197,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnlyPermission,)
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        """Рецепты с данными для чтения при просмотре."""
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.for_read(self.request.user)
+        # Автор нужен для проверки прав на изменение и удаление.
+        return Recipe.objects.select_related('author')
 
     def get_serializer_class(self):
         """Метод для вызова определенного сериализатора."""
@@ -136,11 +212,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return CreateRecipeSerializer
         return ReadRecipeSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+        )
+        instance.delete()
+
+    @action(methods=('GET',),
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            url_path='feed',
+            url_name='feed')
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        queryset = self.filter_queryset(
+            Recipe.objects.for_read(request.user).feed(request.user)
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = ReadRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('GET',),
+            detail=False,
+            url_path='popular',
+            url_name='popular',
+            pagination_class=PopularPagination)
+    def popular(self, request):
+        """Рецепты по убыванию популярности."""
+        queryset = self.filter_queryset(
+            Recipe.objects.for_read(request.user).order_by(
+                '-popularity', '-id'
+            )
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = ReadRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('GET',), detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """Рецепты с похожим набором ингредиентов из готовых списков."""
+        recipes = Recipe.objects.filter(
+            similar_for__recipe_id=pk
+        ).order_by('-similar_for__score', '-id')
+        data = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        ).data
+        if not data:
+            get_object_or_404(Recipe, id=pk)
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(methods=('GET',), detail=True, url_path='get-link')
     def get_link(self, request, pk=None):
         """Получение короткой ссылки на рецепт."""
         recipe = self.get_object()
-        short_link = request.build_absolute_uri(f'/{recipe.short_url}')
+        short_link = request.build_absolute_uri(f'/{recipe.short_code}')
         data = {'short-link': short_link}
         return Response(data, status=status.HTTP_200_OK)
 
@@ -149,14 +279,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,),
             url_name='shopping_cart',
             url_path='shopping_cart')
+    @transaction.atomic
     def add_shopping_item(self, request, pk=None):
         """Добавление/удаление рецепта из списка покупок."""
-        get_object_or_404(Recipe, id=pk)
+        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            return self.__create_obj_recipes(
+            response = self.__create_obj_recipes(
                 ShoppingListSerializer, request, pk
             )
-        return self.__delete_obj_recipes(request, ShoppingList, pk)
+            ShoppingCartIngredient.objects.add_recipe(request.user, recipe)
+            return response
+        response = self.__delete_obj_recipes(request, ShoppingList, pk)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            ShoppingCartIngredient.objects.remove_recipe(request.user, recipe)
+        return response
 
     @action(methods=('GET',),
             detail=False,
@@ -165,22 +301,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
             url_name='download_shopping_cart')
     def download_shopping_list(self, request):
         """Загрузка списка покупок."""
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_recipe__user=request.user
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': f'Неизвестный формат файла: {file_format}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        export, content_type, extension = SHOPPING_LIST_FORMATS[file_format]
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
         ).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(sum=Sum('amount'))
-        result = ''
-        for ingredient in ingredients:
-            result += (
-                f"{ingredient['ingredient__name']}  - "
-                f"{ingredient['sum']}"
-                f"({ingredient['ingredient__measurement_unit']})\n"
-            )
-        response = HttpResponse(result, content_type='text/plain')
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('ingredient__name')
+        response = StreamingHttpResponse(
+            export(ingredients.iterator(chunk_size=EXPORT_CHUNK_SIZE)),
+            content_type=content_type
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{extension}"'
         )
         return response
 
@@ -189,6 +329,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,),
             url_path='favorite',
             url_name='favorite')
+    @transaction.atomic
     def favorite(self, request, pk=None):
         """Добавление/удаление рецепта в избранное."""
         get_object_or_404(Recipe, id=pk)
@@ -204,6 +345,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer_obj = serializer(data=data)
         serializer_obj.is_valid(raise_exception=True)
         serializer_obj.save()
+        change_counter(
+            Recipe.objects.filter(pk=pk),
+            serializer.Meta.model.counter_field, 1
+        )
         return Response(serializer_obj.data, status=status.HTTP_201_CREATED)
 
     def __delete_obj_recipes(self, request, model, pk):
@@ -214,4 +359,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if delete_count == 0:
             return Response({'errors': 'Рецепт уже удален'},
                             status=status.HTTP_400_BAD_REQUEST)
+        change_counter(
+            Recipe.objects.filter(pk=pk), model.counter_field, -delete_count
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
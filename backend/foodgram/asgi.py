@@ -1,7 +1,34 @@
+import asyncio
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+ASGI_URLCONF = 'foodgram.asgi_urls'
+
+
+class FoodgramASGIHandler(ASGIHandler):
+    """ASGI-приложение с async-представлениями для чтения справочников."""
+
+    async def get_response_async(self, request):
+        request.urlconf = ASGI_URLCONF
+        return await super().get_response_async(request)
+
+    def make_view_atomic(self, view):
+        """Синхронные представления считают запросы в своём потоке.
+
+        Django запускает их через sync_to_async, и обёртка соединения
+        из QueryStatsMiddleware туда не попадает.
+        """
+        from api.middleware import count_queries
+
+        view = super().make_view_atomic(view)
+        if asyncio.iscoroutinefunction(view):
+            return view
+        return count_queries(view)
+
+
+django.setup(set_prefix=False)
+application = FoodgramASGIHandler()
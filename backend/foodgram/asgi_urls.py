@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib import admin
+from django.conf.urls.static import static
+from django.urls import path, include
+
+from recipes.views import async_redirect_to_full_recipe
+
+# Маршруты ASGI-приложения: справочники и короткие ссылки обслуживаются
+# async-представлениями. WSGI-приложение использует foodgram.urls.
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('api.asgi_urls', namespace='api')),
+    path('s/<str:short_url>', async_redirect_to_full_recipe),
+] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.middleware.QueryStatsMiddleware",
 ]
 
 ROOT_URLCONF = "foodgram.urls"
@@ -120,6 +122,10 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 AUTH_USER_MODEL = "users.FoodgramUser"
 
+# Покрывающие индексы работают только в PostgreSQL, в SQLite include
+# просто игнорируется.
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -132,6 +138,87 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": PAGE_SIZE,
 }
 
+QUERY_STATS_HEADERS = DEBUG
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Сколько лучших рецептов возвращает поиск по индексу в памяти, который
+# заменяет полнотекстовый поиск PostgreSQL в остальных базах.
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+
+# Версии справочников и рецептов в кэше общие для всех процессов: воркеров
+# gunicorn и команд manage.py. Файловый кэш не требует отдельного сервиса;
+# если бэкенд работает на нескольких машинах, CACHE_BACKEND и
+# CACHE_LOCATION указывают общий кэш, например DatabaseCache.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv(
+            "CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "foodgram-cache")
+        ),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+# Тесты и команды на временной базе работают со своим кэшем в памяти
+# процесса: в общем кэше лежат версии и ответы основной базы.
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+TEST_RUNNER = "foodgram.test_runner.FoodgramTestRunner"
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+SHORT_LINK_CACHE_SIZE = 10000
+
+# Лента подписок: сколько рецептов хранится в ленте пользователя и сколько
+# подписчиков может быть у автора, чтобы его рецепты раскладывались по
+# лентам при публикации. Рецепты более популярных авторов читаются
+# напрямую при запросе ленты.
+FEED_TIMELINE_LENGTH = int(os.getenv("FEED_TIMELINE_LENGTH", 500))
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv("FEED_FANOUT_MAX_FOLLOWERS", 1000))
+
+# Популярность рецептов: вклад добавления в избранное или список покупок
+# уменьшается вдвое за POPULARITY_HALF_LIFE_DAYS дней.
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WEIGHTS = {"favorites": 2.0, "carts": 1.0}
+
+# Сколько похожих рецептов хранится для каждого рецепта и в какой доле
+# рецептов ингредиент может встречаться, чтобы учитываться в сходстве.
+SIMILAR_RECIPES_COUNT = 12
+SIMILAR_MAX_DF_SHARE = 0.1
+
+# Уменьшенные копии изображений: имя размера -> длинная сторона в пикселях.
+RECIPE_IMAGE_RENDITIONS = {"card": 960, "thumb": 320}
+AVATAR_RENDITIONS = {"small": 128}
+RENDITION_QUALITY = 80
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", 2))
+
+# Ограничения для изображений, загружаемых в base64.
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv("IMAGE_UPLOAD_MAX_SIZE", 10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_DIMENSION = 8000
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.queries": {
+            "handlers": ["console"],
+            "level": os.getenv("QUERY_LOG_LEVEL", "INFO" if DEBUG else "WARNING"),
+            "propagate": False,
+        },
+    },
+}
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "HIDE_USERS": False,
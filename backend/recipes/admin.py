@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from recipes.models import (Tag, Ingredient, Favourites, Recipe,
-                            IngredientRecipe, TagRecipe, ShoppingList)
+                            IngredientRecipe, TagRecipe, ShoppingList,
+                            SimilarRecipe)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -26,7 +27,10 @@ class TagsInLine(admin.StackedInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'pub_date', 'text')
+    list_display = (
+        'id', 'name', 'author', 'pub_date', 'favorites_count',
+        'in_carts_count', 'text'
+    )
     search_fields = ('name', 'author')
     list_filter = ('author', 'name', 'tags')
     inlines = (IngredientsInLine, TagsInLine)
@@ -53,8 +57,14 @@ class ShoppingListAdmin(admin.ModelAdmin):
     empty_value_display = 'Поле не заполнено'
 
 
+class SimilarRecipeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipe', 'similar', 'score')
+    empty_value_display = 'Поле не заполнено'
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Favourites, FavouritesRecipeAdmin)
 admin.site.register(ShoppingList, ShoppingListAdmin)
+admin.site.register(SimilarRecipe, SimilarRecipeAdmin)
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def new_version():
+    """Версия — время изменения в наносекундах.
+
+    В отличие от счётчика она не повторяется, если кэш потерял ключ,
+    и не требует атомарного incr, которого нет у файлового кэша.
+    """
+    return time.time_ns()
+
+
+def get_catalog_version():
+    """Текущая версия справочников тегов и ингредиентов и время изменения."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version, version / 1e9
+
+
+def bump_catalog_version():
+    """Новая версия справочников после изменения тега или ингредиента."""
+    cache.set(CATALOG_VERSION_KEY, new_version(), timeout=None)
+
+
+def catalog_lookup(basename, renderer_format, *args):
+    """ETag, время изменения и ключ кэша ответа справочника.
+
+    Ключ строится из представления и аргументов, которые оно читает,
+    а не из адреса запроса: произвольная строка запроса не создаёт
+    новых записей в кэше.
+    """
+    version, modified = get_catalog_version()
+    etag = f'"{basename}-{version}-{renderer_format}"'
+    key = ':'.join(
+        str(part)
+        for part in ('catalog', version, renderer_format, basename, *args)
+    )
+    return etag, int(modified), key
+
+
+def get_catalog_data(key, get_data, use_cache=True):
+    """Данные ответа справочника из кэша или от get_data().
+
+    Пустой результат, например для несуществующего объекта, не кэшируется.
+    """
+    data = cache.get(key) if use_cache else None
+    if data is None:
+        data = get_data()
+        if use_cache and data is not None:
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,129 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+from foodgram.asgi import FoodgramASGIHandler
+from recipes.sample_data import create_sample_data, temporary_database
+
+HOST = 'localhost'
+
+
+def percentile(timings, share):
+    return sorted(timings)[min(len(timings) - 1, int(len(timings) * share))]
+
+
+def call_wsgi(handler, path, query):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'HTTP_HOST': HOST,
+        'wsgi.input': BytesIO(),
+        'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    response = handler(
+        environ, lambda status, headers: statuses.append(status)
+    )
+    b''.join(response)
+    response.close()
+    return int(statuses[0].split()[0])
+
+
+async def call_asgi(handler, path, query):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(b'host', HOST.encode())],
+        'server': (HOST, 80),
+        'client': ('127.0.0.1', 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status']
+
+
+class Command(BaseCommand):
+    help = ('Сравнение пропускной способности WSGI и ASGI на маршрутах '
+            'чтения при высокой конкурентности, без сетевого сервера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            data = create_sample_data(recipes=60, ingredients=200)
+            recipe = data['recipes'][0]
+            paths = (
+                ('/api/tags/', ''),
+                ('/api/ingredients/', urlencode({'name': 'Инг'})),
+                (f'/api/ingredients/{data["ingredients"][0].pk}/', ''),
+                (f'/s/{recipe.short_code}', ''),
+                ('/api/recipes/', 'limit=6'),
+            )
+            self.stdout.write('stack\tpath\trps\tp50_ms\tp95_ms')
+            for path, query in paths:
+                self.report('wsgi', path, *self.run_wsgi(
+                    path, query, options['requests'], options['concurrency']
+                ))
+                self.report('asgi', path, *asyncio.run(self.run_asgi(
+                    path, query, options['requests'], options['concurrency']
+                )))
+
+    def report(self, stack, path, elapsed, timings):
+        self.stdout.write(
+            f'{stack}\t{path}\t{len(timings) / elapsed:.0f}\t'
+            f'{statistics.median(timings):.2f}\t'
+            f'{percentile(timings, 0.95):.2f}'
+        )
+
+    def run_wsgi(self, path, query, total, concurrency):
+        handler = WSGIHandler()
+
+        def timed(_):
+            start = time.perf_counter()
+            status = call_wsgi(handler, path, query)
+            assert status < 400, (path, status)
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            timings = list(executor.map(timed, range(total)))
+        return time.perf_counter() - start, timings
+
+    async def run_asgi(self, path, query, total, concurrency):
+        handler = FoodgramASGIHandler()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed():
+            async with semaphore:
+                start = time.perf_counter()
+                status = await call_asgi(handler, path, query)
+                assert status < 400, (path, status)
+                return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(timed() for _ in range(total)))
+        return time.perf_counter() - start, timings
@@ -0,0 +1,75 @@
+import statistics
+import time
+from base64 import b64encode
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from recipes.sample_data import SAMPLE_IMAGE, temporary_database
+
+User = get_user_model()
+
+START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение задержки глубоких страниц при разной пагинации.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total, limit = options['recipes'], options['limit']
+        with temporary_database():
+            self.fill(total)
+            client = APIClient()
+            dates = list(Recipe.objects.values_list('pub_date', flat=True))
+            self.stdout.write('page\tpage_ms\tcursor_ms')
+            last_page = total // limit
+            for page in sorted({1, 10, 100, last_page // 2, last_page}):
+                offset = (page - 1) * limit
+                params = {'limit': limit, 'paginate': 'cursor'}
+                if offset:
+                    params['cursor'] = b64encode(urlencode(
+                        {'p': str(dates[offset - 1])}
+                    ).encode()).decode()
+                page_ms = self.measure(
+                    client, {'limit': limit, 'page': page}, options['repeat']
+                )
+                cursor_ms = self.measure(client, params, options['repeat'])
+                self.stdout.write(f'{page}\t{page_ms:.2f}\t{cursor_ms:.2f}')
+
+    def fill(self, total):
+        author = User.objects.create_user(
+            email='bench@foodgram.ru', username='bench',
+            first_name='Имя', last_name='Фамилия', password='bench-pass'
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author, name=f'Рецепт {number}',
+                    text='Описание', cooking_time=1, image=SAMPLE_IMAGE
+                )
+                for number in range(total)
+            ),
+            batch_size=1000
+        )
+        recipes = list(Recipe.objects.only('id'))
+        for recipe in recipes:
+            recipe.pub_date = START_DATE + timedelta(minutes=recipe.id)
+        Recipe.objects.bulk_update(recipes, ('pub_date',), batch_size=1000)
+
+    def measure(self, client, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get('/api/recipes/', params)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.data
+        return statistics.median(timings)
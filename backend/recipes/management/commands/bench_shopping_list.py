@@ -0,0 +1,79 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from api.exporters import SHOPPING_LIST_FORMATS
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartIngredient, ShoppingList)
+from recipes.sample_data import SAMPLE_IMAGE, temporary_database
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замер памяти при выгрузке большого списка покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(1000, 10000, 20000),
+            help='Количество строк списка покупок.'
+        )
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            user = User.objects.create_user(
+                email='bench@foodgram.ru', username='bench',
+                first_name='Имя', last_name='Фамилия', password='bench-pass'
+            )
+            client = APIClient()
+            client.force_authenticate(user)
+            self.stdout.write('rows\tformat\tpeak_kb\tseconds\tbytes')
+            for size in options['sizes']:
+                with transaction.atomic():
+                    self.fill_cart(user, size)
+                    for file_format in SHOPPING_LIST_FORMATS:
+                        self.measure(client, size, file_format)
+                    transaction.set_rollback(True)
+
+    def fill_cart(self, user, size):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number:06}', measurement_unit='г')
+            for number in range(size)
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Большой рецепт', text='Описание',
+            cooking_time=size, image=SAMPLE_IMAGE
+        )
+        IngredientRecipe.objects.bulk_create(
+            (
+                IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=1
+                )
+                for ingredient_id in Ingredient.objects.values_list(
+                    'id', flat=True
+                ).iterator()
+            ),
+            batch_size=1000
+        )
+        ShoppingList.objects.create(user=user, recipe=recipe)
+        ShoppingCartIngredient.objects.add_recipe(user, recipe)
+
+    def measure(self, client, size, file_format):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'file_format': file_format}
+        )
+        length = sum(len(chunk) for chunk in response.streaming_content)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{size}\t{file_format}\t{peak // 1024}\t'
+            f'{seconds:.3f}\t{length}'
+        )
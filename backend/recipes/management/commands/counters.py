@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт или проверка счётчиков рецептов, избранного '
+            'и списков покупок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только найти расхождения со строками в базе.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile_counters(fix=not options['verify'])
+        summary = ', '.join(
+            f'{field}: {count}' for field, count in drift.items()
+        )
+        if options['verify'] and any(drift.values()):
+            raise CommandError(f'Расхождения счётчиков: {summary}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено строк: {summary}.' if not options['verify']
+            else 'Расхождений нет.'
+        ))
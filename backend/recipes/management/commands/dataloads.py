@@ -1,26 +1,196 @@
+import csv
+import io
+import json
 import os
-from csv import DictReader
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes.catalog import bump_catalog_version
+from recipes.constants import (MAX_LENGTH_RECIPES_UNIT_MEASUREMENT,
+                               NAME_MAX_LENGTH_INGREDIENT)
 from recipes.models import Ingredient
 
+FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson',
+           '.jsonl': 'ndjson'}
+JSON_READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        else:
+            yield None
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield from read_objects((json.loads(line),))
+
+
+def read_json(file):
+    """Объекты JSON-массива по одному, без чтения всего файла."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(JSON_READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив объектов.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                obj, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Файл JSON оборван.')
+                break
+            yield from read_objects((obj,))
+        if not chunk:
+            return
+
+
+def read_objects(objects):
+    for obj in objects:
+        if isinstance(obj, dict):
+            yield obj.get('name'), obj.get('measurement_unit')
+        else:
+            yield None
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'ndjson': read_ndjson}
+
+
+def clean_rows(rows, stats):
+    """Проверенные пары (название, единица), неподходящие строки
+    пропускаются и учитываются в статистике.
+    """
+    for row in rows:
+        stats['read'] += 1
+        if row is None or not all(isinstance(value, str) for value in row):
+            stats['skipped'] += 1
+            continue
+        name, unit = row[0].strip(), row[1].strip()
+        if (
+            not name or not unit
+            or len(name) > NAME_MAX_LENGTH_INGREDIENT
+            or len(unit) > MAX_LENGTH_RECIPES_UNIT_MEASUREMENT
+        ):
+            stats['skipped'] += 1
+            continue
+        yield name, unit
+
+
+def load_orm(batch):
+    """Вставка пачки через ORM, возвращает число новых строк."""
+    existing = set(Ingredient.objects.filter(
+        name__in={name for name, _ in batch}
+    ).values_list('name', 'measurement_unit'))
+    new = [pair for pair in batch if pair not in existing]
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit) for name, unit in new),
+        batch_size=len(batch), ignore_conflicts=True
+    )
+    return len(new)
+
+
+def load_copy(batch):
+    """Вставка пачки в PostgreSQL через COPY во временную таблицу."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE ingredient_staging')
+        cursor.cursor.copy_expert(
+            'COPY ingredient_staging (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)', buffer
+        )
+        # Кроме ключа (name, measurement_unit) обновлять нечего.
+        cursor.execute(
+            f'INSERT INTO {Ingredient._meta.db_table} '
+            '(name, measurement_unit) '
+            'SELECT name, measurement_unit FROM ingredient_staging '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+        return cursor.rowcount
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов.'
+    help = 'Загрузка ингредиентов из CSV, JSON или NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data/ingredients.csv')
+        )
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Формат файла, по умолчанию по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--method', choices=('auto', 'copy', 'orm'), default='auto',
+            help='copy доступен только в PostgreSQL.'
+        )
 
     def handle(self, *args, **options):
-        path = os.path.join(settings.BASE_DIR, 'data/ingredients.csv')
-        with open(path, 'r', encoding='utf-8') as file:
-            reader = DictReader(
-                file, fieldnames=('name', 'measurement_unit',)
+        path = options['path']
+        file_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower()
+        )
+        if file_format is None:
+            raise CommandError(
+                'Не удалось определить формат, укажите --format.'
             )
-            ingredients = [
-                Ingredient(
-                    name=row['name'], measurement_unit=row['measurement_unit']
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'orm'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY поддерживается только в PostgreSQL.')
+        load = load_copy if method == 'copy' else load_orm
+
+        stats = dict.fromkeys(('read', 'inserted', 'existing', 'skipped'), 0)
+        start = time.perf_counter()
+        if method == 'copy':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE TEMP TABLE IF NOT EXISTS ingredient_staging '
+                    '(name text, measurement_unit text)'
                 )
-                for row in reader
-            ]
-            Ingredient.objects.bulk_create(ingredients, ignore_conflicts=True)
-            print('Data is load.')
+        with open(path, 'r', encoding='utf-8') as file:
+            rows = clean_rows(READERS[file_format](file), stats)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                unique = list(dict.fromkeys(batch))
+                stats['skipped'] += len(batch) - len(unique)
+                with transaction.atomic():
+                    inserted = load(unique)
+                stats['inserted'] += inserted
+                stats['existing'] += len(unique) - inserted
+        if method == 'copy':
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS ingredient_staging')
+        seconds = time.perf_counter() - start
+        if stats['inserted']:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {stats["read"]}, добавлено {stats["inserted"]}, '
+            f'уже было {stats["existing"]}, пропущено {stats["skipped"]} '
+            f'за {seconds:.2f} с '
+            f'({stats["read"] / max(seconds, 1e-9):.0f} строк/с, {method}).'
+        ))
@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from api.serializers import FollowSerializer
+from recipes.models import (IngredientRecipe, Recipe, ShoppingCartIngredient,
+                            ShoppingList, Tag)
+from recipes.sample_data import create_sample_data, temporary_database
+
+User = get_user_model()
+
+
+def filter_recipes(user, query):
+    """Рецепты, отфильтрованные так же, как в RecipeViewSet."""
+    return RecipeFilter(
+        data=QueryDict(query),
+        queryset=Recipe.objects.for_read(user),
+        request=SimpleNamespace(user=user),
+    ).qs
+
+
+def query_shapes(user, author, recipe):
+    """Запросы, которые выполняют представления api."""
+    page = settings.PAGE_SIZE
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:page])
+    tags = '&'.join(
+        f'tags={slug}'
+        for slug in Tag.objects.values_list('slug', flat=True)[:2]
+    )
+    authors = User.objects.filter(publisher__user=user)
+    return (
+        ('Лента рецептов', Recipe.objects.for_read(user)[:page]),
+        ('Рецепты автора', filter_recipes(user, f'author={author.pk}')[:page]),
+        ('Избранное', filter_recipes(user, 'is_favorited=1')[:page]),
+        ('Список покупок', filter_recipes(
+            user, 'is_in_shopping_cart=1'
+        )[:page]),
+        ('Фильтр по тегам', filter_recipes(user, tags)[:page]),
+        ('Рецепт', Recipe.objects.for_read(user).filter(pk=recipe.pk)),
+        ('Ингредиенты рецептов', IngredientRecipe.objects.filter(
+            recipe__in=recipe_ids
+        ).select_related('ingredient')),
+        ('Теги рецептов', Recipe.tags.through.objects.filter(
+            recipe__in=recipe_ids
+        ).select_related('tag')),
+        ('Подписки', FollowSerializer.get_authors(authors, user)[:page]),
+        ('Рецепты подписок', Recipe.objects.limited_per_author(
+            list(authors.values_list('pk', flat=True)[:page]), 3
+        )),
+        ('Сводный список покупок', ShoppingCartIngredient.objects.filter(
+            user=user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')),
+        ('Корзины с рецептом', ShoppingList.objects.filter(recipe=recipe)),
+        ('Старая короткая ссылка', Recipe.objects.filter(short_url='code')),
+    )
+
+
+def find_full_scans(plan):
+    """Строки плана с полным просмотром таблицы."""
+    if connection.vendor == 'postgresql':
+        return [line.strip() for line in plan.splitlines()
+                if 'Seq Scan' in line]
+    tables = set(connection.introspection.table_names())
+    return [
+        line.strip() for line in plan.splitlines()
+        if 'USING' not in line
+        and line.partition('SCAN ')[2].split(' ')[0] in tables
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN ANALYZE для запросов api и поиск полных просмотров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sample', action='store_true',
+            help='Проверить на временной базе со сгенерированными данными.'
+        )
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если найден полный просмотр.'
+        )
+
+    def handle(self, *args, **options):
+        if options['sample']:
+            with temporary_database():
+                data = create_sample_data(
+                    users=options['users'], recipes=options['recipes']
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                full_scans = self.explain(
+                    data['users'][0], data['users'][1], data['recipes'][0]
+                )
+        else:
+            user = User.objects.filter(follower__isnull=False).first()
+            recipe = Recipe.objects.select_related('author').first()
+            if user is None or recipe is None:
+                raise CommandError(
+                    'В базе нет данных, используйте параметр --sample.'
+                )
+            full_scans = self.explain(user, recipe.author, recipe)
+        if full_scans and options['strict']:
+            raise CommandError(f'Полных просмотров таблиц: {full_scans}')
+
+    def explain(self, user, author, recipe):
+        options = (
+            {'analyze': True} if connection.vendor == 'postgresql' else {}
+        )
+        full_scans = 0
+        for name, queryset in query_shapes(user, author, recipe):
+            plan = queryset.explain(**options)
+            scans = find_full_scans(plan)
+            full_scans += len(scans)
+            style = self.style.WARNING if scans else self.style.SUCCESS
+            self.stdout.write(style(f'== {name}'))
+            self.stdout.write(plan)
+            for line in scans:
+                self.stdout.write(self.style.WARNING(f'!! {line}'))
+        return full_scans
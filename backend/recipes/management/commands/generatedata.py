@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.sample_data import generate_data
+
+
+class Command(BaseCommand):
+    help = 'Генерация данных для нагрузочных проверок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона для авторов и рецептов.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--skip-images', action='store_true',
+            help='Не записывать изображение-заглушку в хранилище.'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        generate_data(
+            users=options['users'], recipes=options['recipes'],
+            tags=options['tags'], ingredients=options['ingredients'],
+            follows=options['follows'], favorites=options['favorites'],
+            carts=options['carts'], skew=options['skew'],
+            seed=options['seed'], batch_size=options['batch_size'],
+            images=not options['skip_images'], report=self.report
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.perf_counter() - start:.1f} с.'
+        ))
+
+    def report(self, name, count, seconds):
+        self.stdout.write(
+            f'{name}: {count} строк за {seconds:.1f} с '
+            f'({count / max(seconds, 1e-9):.0f} строк/с)'
+        )
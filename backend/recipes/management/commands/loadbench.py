@@ -0,0 +1,283 @@
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler)
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from recipes.sample_data import generate_data, temporary_database
+
+# (имя маршрута, объект для аргумента pk/id, параметры, авторизация, вес)
+# Параметры со значением None заполняются случайным объектом.
+# Только чтение: повтор записи неидемпотентен и меняет данные между
+# прогонами.
+MIX = (
+    ('recipes-list', None, {}, False, 30),
+    ('recipes-list', None, {'paginate': 'cursor'}, False, 5),
+    ('recipes-list', None, {'is_favorited': 1}, True, 5),
+    ('recipes-list', None, {'tags': None}, False, 5),
+    ('recipes-detail', 'recipes', {}, True, 20),
+    ('recipes-feed', None, {}, True, 5),
+    ('recipes-popular', None, {}, False, 5),
+    ('recipes-popular', None, {'tags': None}, False, 2),
+    ('recipes-similar', 'recipes', {}, False, 3),
+    ('recipes-get-link', 'recipes', {}, False, 3),
+    ('recipes-download_shopping_cart', None, {}, True, 2),
+    ('tags-list', None, {}, False, 5),
+    ('ingredients-list', None, {'name': 'Инг'}, False, 10),
+    ('ingredients-detail', 'ingredients', {}, False, 2),
+    ('users-list', None, {}, False, 3),
+    ('users-detail', 'users', {}, False, 3),
+    ('users-me', None, {}, True, 2),
+    ('users-subscriptions', None, {'recipes_limit': 3}, True, 5),
+)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_server():
+    """HTTP-сервер Django в отдельном потоке на свободном порту."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(WSGIHandler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(url, token=None):
+    request = Request(url)
+    if token:
+        request.add_header('Authorization', f'Token {token}')
+    start = time.perf_counter()
+    try:
+        with urlopen(request) as response:
+            response.read()
+            status, headers = response.status, response.headers
+    except HTTPError as error:
+        status, headers = error.code, error.headers
+    elapsed = (time.perf_counter() - start) * 1000
+    queries = headers.get('X-Query-Count')
+    return status, elapsed, None if queries is None else int(queries)
+
+
+def get_json(url, token=None):
+    request = Request(url)
+    if token:
+        request.add_header('Authorization', f'Token {token}')
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def discover(base_url):
+    """Идентификаторы объектов, доступных через api."""
+    def results(data):
+        return data['results'] if isinstance(data, dict) else data
+
+    return {
+        'recipes': [obj['id'] for obj in results(get_json(
+            f'{base_url}{reverse("api:recipes-list")}?limit=100'
+        ))],
+        'users': [obj['id'] for obj in results(get_json(
+            f'{base_url}{reverse("api:users-list")}?limit=100'
+        ))],
+        'ingredients': [obj['id'] for obj in get_json(
+            f'{base_url}{reverse("api:ingredients-list")}'
+        )][:100],
+        'tags': [obj['slug'] for obj in get_json(
+            f'{base_url}{reverse("api:tags-list")}'
+        )],
+    }
+
+
+def summarize(samples, elapsed):
+    timings = [sample[1] for sample in samples]
+    cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else (
+        timings * 99
+    )
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample[0] >= 400),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(cuts[49], 2),
+        'p95_ms': round(cuts[94], 2),
+        'p99_ms': round(cuts[98], 2),
+        'queries': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон смеси запросов к api с задержками '
+            'p50/p95/p99 и числом SQL-запросов по маршрутам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного бэкенда. По умолчанию сервер '
+                 'поднимается на временной базе со сгенерированными данными.'
+        )
+        parser.add_argument(
+            '--token', help='Токен пользователя для запросов с авторизацией.'
+        )
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument(
+            '--compare', help='Результаты прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый относительный рост p95.'
+        )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            result = self.run(options['url'], options['token'], options)
+        else:
+            with temporary_database(), override_settings(
+                QUERY_STATS_HEADERS=True
+            ):
+                data = generate_data(
+                    users=options['users'], recipes=options['recipes'],
+                    seed=options['seed'], images=False
+                )
+                token = Token.objects.create(
+                    user_id=data['user_ids'][0]
+                ).key
+                with local_server() as base_url:
+                    result = self.run(base_url, token, options)
+        self.print_result(result)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                regressions = self.compare(
+                    json.load(file), result, options['threshold']
+                )
+            if regressions:
+                raise CommandError(f'Найдено регрессий: {regressions}')
+
+    def run(self, base_url, token, options):
+        objects = discover(base_url)
+        mix = [entry for entry in MIX if token or not entry[3]]
+        rng = random.Random(options['seed'])
+        plan = []
+        for name, kind, params, auth, _ in rng.choices(
+            mix, weights=[entry[4] for entry in mix], k=options['requests']
+        ):
+            kwargs = {}
+            if kind is not None:
+                key = 'id' if kind == 'users' else 'pk'
+                kwargs[key] = rng.choice(objects[kind])
+            url = base_url + reverse(f'api:{name}', kwargs=kwargs)
+            label = ' '.join([name] + [
+                f'{key}={"*" if value is None else value}'
+                for key, value in params.items()
+            ])
+            if params:
+                url += '?' + urlencode({
+                    key: rng.choice(objects[key]) if value is None else value
+                    for key, value in params.items()
+                })
+            plan.append((label, url, token if auth else None))
+
+        def timed(entry):
+            label, url, auth_token = entry
+            return label, fetch(url, auth_token)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            samples = list(pool.map(timed, plan))
+        elapsed = time.perf_counter() - start
+        by_label = defaultdict(list)
+        for label, sample in samples:
+            by_label[label].append(sample)
+        return {
+            'revision': git_revision(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'concurrency': options['concurrency'],
+            'seed': options['seed'],
+            'total': summarize([sample for _, sample in samples], elapsed),
+            'endpoints': {
+                label: summarize(by_label[label], elapsed)
+                for label in sorted(by_label)
+            },
+        }
+
+    def print_result(self, result):
+        self.stdout.write('endpoint\trequests\terrors\tp50\tp95\tp99\tqueries')
+        rows = list(result['endpoints'].items()) + [
+            ('total', result['total'])
+        ]
+        for label, stats in rows:
+            self.stdout.write(
+                f'{label}\t{stats["requests"]}\t{stats["errors"]}\t'
+                f'{stats["p50_ms"]}\t{stats["p95_ms"]}\t{stats["p99_ms"]}\t'
+                f'{stats["queries"]}'
+            )
+        self.stdout.write(f'rps: {result["total"]["rps"]}')
+
+    def compare(self, baseline, result, threshold):
+        """Сравнение с прошлым прогоном, возвращает число регрессий."""
+        regressions = 0
+        for label, stats in result['endpoints'].items():
+            old = baseline['endpoints'].get(label)
+            if old is None:
+                continue
+            problems = []
+            if stats['p95_ms'] > old['p95_ms'] * (1 + threshold):
+                problems.append(
+                    f'p95 {old["p95_ms"]} -> {stats["p95_ms"]} мс'
+                )
+            if (
+                stats['queries'] is not None and old['queries'] is not None
+                and stats['queries'] > old['queries']
+            ):
+                problems.append(
+                    f'запросов {old["queries"]} -> {stats["queries"]}'
+                )
+            if stats['errors'] > old['errors']:
+                problems.append(f'ошибок {old["errors"]} -> {stats["errors"]}')
+            if problems:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(
+                    f'{label}: ' + ', '.join(problems)
+                ))
+        return regressions
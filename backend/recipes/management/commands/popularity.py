@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import recompute
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт популярности рецептов по добавлениям в избранное '
+            'и списки покупок с прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать по всем добавлениям, в том числе учесть '
+                 'удалённые.'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        events, recipes = recompute(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтено добавлений: {events}, обновлено рецептов: {recipes} '
+            f'за {time.perf_counter() - start:.2f} с.'
+        ))
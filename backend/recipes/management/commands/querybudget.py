@@ -0,0 +1,252 @@
+import base64
+import tempfile
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.sample_data import create_sample_data, temporary_database
+
+# (имя маршрута, метод, аргументы, параметры, авторизация, бюджет запросов)
+# Параметры-строка — имя тела запроса из объектов выборки.
+BUDGETS = (
+    ('api-root', 'get', {}, {}, False, 0),
+    ('tags-list', 'get', {}, {}, False, 1),
+    ('tags-detail', 'get', {'pk': 'tag'}, {}, False, 1),
+    ('ingredients-list', 'get', {}, {'name': 'Инг'}, False, 1),
+    ('ingredients-detail', 'get', {'pk': 'ingredient'}, {}, False, 1),
+    ('recipes-list', 'get', {}, {}, False, 4),
+    ('recipes-list', 'get', {}, {'paginate': 'cursor'}, False, 3),
+    ('recipes-list', 'get', {}, {}, True, 4),
+    ('recipes-list', 'get', {}, {'is_favorited': 1}, True, 4),
+    ('recipes-list', 'get', {}, {'is_in_shopping_cart': 1}, True, 4),
+    ('recipes-list', 'get', {}, {'tags': ('tag0', 'tag1')}, True, 5),
+    ('recipes-list', 'get', {}, {'search': 'рецепты'}, False, 5),
+    # Вне PostgreSQL поиск сначала читает id отфильтрованных рецептов.
+    ('recipes-list', 'get', {}, {'search': 'рецепт', 'tags': 'tag0'}, True,
+     6),
+    ('recipes-list', 'post', {}, 'new_recipe', True, 14),
+    ('recipes-detail', 'get', {'pk': 'recipe'}, {}, True, 3),
+    ('recipes-detail', 'patch', {'pk': 'recipe'}, 'recipe_changes', True,
+     18),
+    ('recipes-detail', 'delete', {'pk': 'recipe'}, {}, True, 16),
+    ('recipes-feed', 'get', {}, {}, True, 4),
+    ('recipes-feed', 'get', {}, {'paginate': 'cursor'}, True, 3),
+    ('recipes-popular', 'get', {}, {}, False, 4),
+    ('recipes-popular', 'get', {}, {'paginate': 'cursor'}, False, 3),
+    ('recipes-popular', 'get', {}, {'tags': ('tag0',)}, True, 5),
+    ('recipes-similar', 'get', {'pk': 'recipe'}, {}, False, 1),
+    ('recipes-get-link', 'get', {'pk': 'recipe'}, {}, True, 1),
+    ('recipes-favorite', 'post', {'pk': 'other_recipe'}, {}, True, 8),
+    ('recipes-favorite', 'delete', {'pk': 'recipe'}, {}, True, 5),
+    ('recipes-shopping_cart', 'post', {'pk': 'other_recipe'}, {}, True, 12),
+    ('recipes-shopping_cart', 'delete', {'pk': 'recipe'}, {}, True, 8),
+    ('recipes-download_shopping_cart', 'get', {}, {}, True, 1),
+    ('users-list', 'get', {}, {}, False, 2),
+    ('users-list', 'get', {}, {}, True, 2),
+    ('users-list', 'post', {}, 'new_user', False, 5),
+    ('users-detail', 'get', {'id': 'author'}, {}, True, 1),
+    ('users-me', 'get', {}, {}, True, 1),
+    ('users-avatar', 'put', {}, 'avatar', True, 1),
+    ('users-avatar', 'delete', {}, {}, True, 1),
+    ('users-subscriptions', 'get', {}, {'recipes_limit': 2}, True, 3),
+    ('users-subscribe', 'post', {'id': 'stranger'}, {}, True, 13),
+    ('users-subscribe', 'delete', {'id': 'author'}, {}, True, 5),
+)
+
+# Выборки разного размера: число запросов не должно зависеть от числа
+# пользователей, подписок и рецептов на странице.
+SAMPLE_SIZES = (
+    {},
+    {'users': 10, 'recipes': 40, 'tags': 6, 'ingredients': 30},
+)
+
+# Маршруты djoser для писем, смены пароля и токенов: не относятся
+# к горячему пути и требуют состояния вне базы.
+SKIPPED = (
+    'activation', 'resend-activation', 'reset-password',
+    'reset-password-confirm', 'reset-username', 'reset-username-confirm',
+    'set-password', 'set-username', 'login', 'logout',
+)
+# Методы, которые фронтенд не вызывает: профиль меняется только через
+# аватар, рецепт — через PATCH.
+SKIPPED_METHODS = (
+    ('users-me', 'put'), ('users-me', 'patch'), ('users-me', 'delete'),
+    ('users-detail', 'put'), ('users-detail', 'patch'),
+    ('users-detail', 'delete'), ('recipes-detail', 'put'),
+)
+
+
+def iter_routes(patterns):
+    """Имена маршрутов и методы, которые они принимают."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            actions = getattr(pattern.callback, 'actions', None)
+            for method in actions or ('get',):
+                # DRF добавляет head после первого запроса, он повторяет get.
+                if method != 'head':
+                    yield pattern.name, method
+
+
+def sample_image_data():
+    """Картинка 1x1 в формате data URI для запросов с изображением."""
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def request_bodies(data):
+    """Тела запросов на запись для объектов выборки."""
+    ingredients = data['ingredients']
+    tags = data['tags']
+    return {
+        'new_recipe': {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in ingredients[:3]
+            ],
+            'tags': [tag.pk for tag in tags[:2]],
+            'name': 'Новый рецепт',
+            'image': sample_image_data(),
+            'text': 'Описание рецепта',
+            'cooking_time': 5,
+        },
+        # Один ингредиент остаётся, один меняет количество, один новый.
+        'recipe_changes': {
+            'ingredients': [
+                {'id': ingredients[0].pk, 'amount': 1},
+                {'id': ingredients[1].pk, 'amount': 100},
+                {'id': ingredients[-1].pk, 'amount': 5},
+            ],
+            'tags': [tags[-1].pk],
+            'name': 'Изменённый рецепт',
+            'text': 'Новое описание',
+            'cooking_time': 15,
+        },
+        'new_user': {
+            'email': 'budget@foodgram.ru',
+            'username': 'budget',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': 'budget-password-1',
+        },
+        'avatar': {'avatar': sample_image_data()},
+    }
+
+
+def missing_budgets():
+    """Маршруты и методы api, для которых нет записи в BUDGETS."""
+    from api.urls import urlpatterns
+
+    covered = {(name, method) for name, method, *_ in BUDGETS}
+    return sorted(
+        f'{method.upper()} {name}'
+        for name, method in set(iter_routes(urlpatterns))
+        if (name, method) not in covered
+        and (name, method) not in SKIPPED_METHODS
+        and not name.endswith(SKIPPED)
+        and not name.startswith('foodgramuser-')
+    )
+
+
+def measure_queries(data):
+    """Запросы к маршрутам из BUDGETS на данных выборки.
+
+    Для каждой записи возвращает адрес, параметры, статус ответа и число
+    SQL-запросов. Каждый запрос откатывается и не меняет данные для
+    следующих.
+    """
+    reader = data['users'][0]
+    objects = {
+        'tag': data['tags'][0].pk,
+        'ingredient': data['ingredients'][0].pk,
+        'recipe': data['recipes'][0].pk,
+        'other_recipe': data['recipes'][1].pk,
+        'author': data['users'][1].pk,
+        'stranger': data['users'][-1].pk,
+        **request_bodies(data),
+    }
+    results = []
+    for name, method, kwargs, params, auth, _ in BUDGETS:
+        label = params if isinstance(params, str) else dict(params)
+        client = APIClient()
+        if auth:
+            client.force_authenticate(reader)
+        url = reverse(f'api:{name}', kwargs={
+            key: objects[value] for key, value in kwargs.items()
+        })
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as context:
+                if isinstance(params, str):
+                    response = getattr(client, method)(
+                        url, objects[params], format='json'
+                    )
+                else:
+                    response = getattr(client, method)(url, params)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        results.append((url, label, response.status_code, len(context)))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Проверка бюджета SQL-запросов для маршрутов api.'
+
+    def handle(self, *args, **options):
+        missing = missing_budgets()
+        if missing:
+            raise CommandError(
+                'Нет бюджета для маршрутов: ' + ', '.join(missing)
+            )
+        failures = 0
+        counts = []
+        for sizes in SAMPLE_SIZES:
+            self.stdout.write(f'Выборка: {sizes or "по умолчанию"}')
+            # Картинки из запросов сохраняются во временный каталог.
+            with temporary_database(), tempfile.TemporaryDirectory(
+            ) as media_root, override_settings(MEDIA_ROOT=media_root):
+                sample_failures, sample_counts = self.check_budgets(
+                    create_sample_data(**sizes)
+                )
+            failures += sample_failures
+            counts.append(sample_counts)
+        for entry, *entry_counts in zip(BUDGETS, *counts):
+            if len(set(entry_counts)) > 1:
+                failures += 1
+                name, method, _, params, auth, _ = entry
+                self.stdout.write(
+                    f'FAIL {method.upper()} {name} {params} auth={auth}: '
+                    f'число запросов зависит от размера данных '
+                    f'{entry_counts}'
+                )
+        if failures:
+            raise CommandError(f'Превышен бюджет запросов: {failures}')
+        self.stdout.write(self.style.SUCCESS('Бюджет запросов соблюдён.'))
+
+    def check_budgets(self, data):
+        failures = 0
+        counts = []
+        for entry, (url, label, status_code, queries) in zip(
+            BUDGETS, measure_queries(data)
+        ):
+            _, method, _, _, auth, budget = entry
+            counts.append(queries)
+            status = 'OK'
+            if status_code >= 400 or queries > budget:
+                status = 'FAIL'
+                failures += 1
+            self.stdout.write(
+                f'{status} {method.upper()} {url} {label} '
+                f'auth={auth} status={status_code} '
+                f'queries={queries}/{budget}'
+            )
+        return failures, counts
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.renditions import RENDITION_FIELDS, generate
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий изображений, которых ещё нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать копии всех изображений, в том числе '
+                 'неудавшиеся, например после изменения размеров.'
+        )
+
+    def handle(self, *args, **options):
+        for model, (field_name, _) in RENDITION_FIELDS.items():
+            queryset = model.objects.exclude(
+                **{f'{field_name}__isnull': True}
+            ).exclude(**{field_name: ''})
+            if not options['all']:
+                queryset = queryset.filter(
+                    **{f'{field_name}_renditions': {}}
+                )
+            done = 0
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                generate(model, pk)
+                done += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: обработано {done}.'
+            ))
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from recipes.models import Recipe
+from recipes.sample_data import (RECIPE_WORDS, generate_data,
+                                 temporary_database)
+from recipes.search import recipe_index, search_recipes
+
+
+def naive_search(queryset, query):
+    """Поиск подстрок через icontains, с которым идёт сравнение."""
+    for word in query.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(text__icontains=word)
+        )
+    return queryset
+
+
+def percentile(timings, share):
+    return sorted(timings)[min(len(timings) - 1, int(len(timings) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Замер поиска рецептов по названию и описанию на временной '
+            'базе со сгенерированными рецептами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument(
+            '--naive-queries', type=int, default=20,
+            help='Число запросов для сравнения с icontains, 0 — без него.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            start = time.perf_counter()
+            generate_data(
+                users=options['users'], recipes=options['recipes'],
+                seed=options['seed'], images=False,
+                ingredients_per_recipe=(0, 0)
+            )
+            self.stdout.write(
+                f'Сгенерировано рецептов: {options["recipes"]} '
+                f'за {time.perf_counter() - start:.1f} с.'
+            )
+            if connection.vendor != 'postgresql':
+                start = time.perf_counter()
+                recipe_index.search('', 1)
+                self.stdout.write(
+                    f'Индекс в памяти построен за '
+                    f'{time.perf_counter() - start:.1f} с.'
+                )
+            rng = random.Random(options['seed'])
+            queries = [
+                ' '.join(rng.sample(RECIPE_WORDS, rng.randint(1, 2)))
+                for _ in range(options['queries'])
+            ]
+            self.stdout.write('method\tqueries\tp50_ms\tp95_ms\tmatches')
+            self.report(
+                f'search ({connection.vendor})', queries, search_recipes
+            )
+            if options['naive_queries']:
+                self.report(
+                    'icontains', queries[:options['naive_queries']],
+                    naive_search
+                )
+
+    def report(self, method, queries, search):
+        timings = []
+        matches = []
+        for query in queries:
+            start = time.perf_counter()
+            queryset = search(Recipe.objects.all(), query)
+            if method.startswith('search'):
+                queryset = queryset.order_by(
+                    '-search_rank', *Recipe._meta.ordering
+                )
+            # Как при постраничном выводе: первая страница и число строк.
+            list(queryset.values_list('id', flat=True)[:settings.PAGE_SIZE])
+            matches.append(queryset.count())
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'{method}\t{len(queries)}\t{statistics.median(timings):.2f}\t'
+            f'{percentile(timings, 0.95):.2f}\t'
+            f'{statistics.mean(matches):.0f}'
+        )
+        # Подсказка, когда индекс в памяти упирается в предел выдачи.
+        if method.startswith('search') and connection.vendor != 'postgresql':
+            capped = sum(
+                1 for count in matches
+                if count >= settings.RECIPE_SEARCH_FALLBACK_LIMIT
+            )
+            if capped:
+                self.stdout.write(
+                    f'Запросов с выдачей, обрезанной до '
+                    f'RECIPE_SEARCH_FALLBACK_LIMIT: {capped}.'
+                )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт или проверка сводных списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить сохранённые списки с пересчитанными.'
+        )
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='user_ids',
+            help='Идентификаторы пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['verify']:
+            with transaction.atomic():
+                ShoppingCartIngredient.objects.rebuild(user_ids)
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок пересчитаны.')
+            )
+            return
+        stored = ShoppingCartIngredient.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in stored.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingCartIngredient.objects.expected(user_ids).iterator()
+        }
+        drifted = sorted({
+            key[0] for key in actual.keys() | expected.keys()
+            if actual.get(key) != expected.get(key)
+        })
+        if drifted:
+            raise CommandError(
+                'Расхождения у пользователей: '
+                + ', '.join(map(str, drifted))
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
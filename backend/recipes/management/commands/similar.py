@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similar import np, refresh
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт списков похожих рецептов для рецептов, у которых '
+            'изменился состав.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать списки всех рецептов.'
+        )
+        parser.add_argument(
+            '--no-numpy', action='store_true',
+            help='Считать на чистом Python, даже если есть numpy и scipy.'
+        )
+
+    def handle(self, *args, **options):
+        use_numpy = np is not None and not options['no_numpy']
+        start = time.perf_counter()
+        recipes = refresh(full=options['full'], use_numpy=use_numpy)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {recipes} за '
+            f'{time.perf_counter() - start:.2f} с '
+            f'({"numpy" if use_numpy else "python"}).'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Построение лент подписок заново по подпискам и рецептам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='user_ids',
+            help='Идентификаторы пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS('Ленты подписок построены.'))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_url',
+            field=models.CharField(blank=True, db_index=True, help_text='Код короткой ссылки для рецептов, созданных до перехода на коды из идентификатора.', max_length=20, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def counted(source, link):
+    return Coalesce(models.Subquery(
+        source.objects.filter(**{link: models.OuterRef('pk')}).order_by()
+        .values(link).annotate(total=models.Count('pk')).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favourites = apps.get_model('recipes', 'Favourites')
+    ShoppingList = apps.get_model('recipes', 'ShoppingList')
+    User.objects.update(recipes_count=counted(Recipe, 'author'))
+    Recipe.objects.update(
+        favorites_count=counted(Favourites, 'recipe'),
+        in_carts_count=counted(ShoppingList, 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_renditions'),
+        ('users', '0006_foodgramuser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Столбец вычисляется самим PostgreSQL при каждой записи рецепта,
+# поэтому остаётся актуальным без участия приложения. В других базах
+# поиск идёт по индексу в памяти (recipes.search.RecipeIndex).
+ADD_SEARCH_VECTOR = '''
+ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+) STORED;
+CREATE INDEX recipe_search_vector_idx ON recipes_recipe
+USING gin (search_vector);
+'''
+DROP_SEARCH_VECTOR = '''
+DROP INDEX IF EXISTS recipe_search_vector_idx;
+ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector;
+'''
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ADD_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
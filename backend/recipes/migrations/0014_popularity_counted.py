@@ -0,0 +1,46 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+
+def mark_counted(apps, schema_editor):
+    """Добавления до прошлого пересчёта уже вошли в популярность."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    since = Recipe.objects.aggregate(
+        since=models.Max('popularity_at')
+    )['since']
+    if since is None:
+        return
+    for name in ('Favourites', 'ShoppingList'):
+        apps.get_model('recipes', name).objects.filter(
+            created_at__lte=since
+        ).update(popularity_counted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favourites',
+            name='popularity_counted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Учтено в популярности'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='popularity_counted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Учтено в популярности'),
+        ),
+        migrations.AddIndex(
+            model_name='favourites',
+            index=models.Index(condition=models.Q(('popularity_counted', False)), fields=['id'], name='favourites_uncounted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglist',
+            index=models.Index(condition=models.Q(('popularity_counted', False)), fields=['id'], name='shoppinglist_uncounted_idx'),
+        ),
+        migrations.RunPython(mark_counted, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,14 @@
 from sqids import Sqids
-from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
+from django.core.exceptions import EmptyResultSet, ValidationError
 from django.core.validators import MinValueValidator
-from django.db.models import UniqueConstraint
+from django.db.models import (Case, Count, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, UniqueConstraint, Value, When,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, RowNumber
 from django.db import models
 
 from recipes.constants import (
@@ -12,9 +16,28 @@ from recipes.constants import (
     MAX_LENGTH_TAG_NAME, MAX_LENGTH_TAG_SLUG, MIN_VALUE,
     NAME_MAX_LENGTH_RECIPES, NAME_MAX_LENGTH_INGREDIENT
 )
+from users.models import Follow
 
 User = get_user_model()
 
+short_code_sqids = Sqids()
+
+
+def encode_short_code(pk):
+    """Код короткой ссылки из идентификатора рецепта."""
+    return short_code_sqids.encode((pk,))
+
+
+def decode_short_code(code):
+    """Идентификатор рецепта из кода короткой ссылки.
+
+    Для кодов, созданных до перехода на идентификаторы, возвращает None.
+    """
+    ids = short_code_sqids.decode(code)
+    if len(ids) == 1 and short_code_sqids.encode(ids) == code:
+        return ids[0]
+    return None
+
 
 class Tag(models.Model):
     """Модель тега."""
@@ -72,6 +95,94 @@ class Ingredient(models.Model):
             })
 
 
+def has_many_followers(author):
+    """Больше ли у автора подписчиков, чем раскладывается по лентам.
+
+    Подписчики считаются не дальше порога, поэтому проверка дешёвая
+    и для авторов с миллионами подписчиков.
+    """
+    return Exists(Follow.objects.filter(author=author).order_by()[
+        settings.FEED_FANOUT_MAX_FOLLOWERS:
+    ])
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов к рецептам."""
+
+    def with_user_flags(self, user):
+        """Отметки избранного и списка покупок для пользователя."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourites.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def with_author_subscription(self, user):
+        """Отметка подписки пользователя на автора рецепта."""
+        if not user.is_authenticated:
+            return self.annotate(author_is_subscribed=Value(
+                False, output_field=models.BooleanField()
+            ))
+        return self.annotate(author_is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('author'))
+        ))
+
+    def limited_per_author(self, authors, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        ranked = self.filter(author__in=authors).annotate(
+            recipe_rank=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).order_by().values('id', 'recipe_rank')
+        try:
+            sql, params = ranked.query.sql_with_params()
+        except EmptyResultSet:
+            # Пустой список авторов, например страница без подписок.
+            return self.none()
+        return self.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s',
+            (*params, limit)
+        ))
+
+    def feed(self, user):
+        """Рецепты авторов из подписок пользователя.
+
+        Рецепты берутся из ленты пользователя, а у авторов с большим
+        числом подписчиков, которые по лентам не раскладываются, читаются
+        напрямую.
+        """
+        return self.filter(
+            Q(id__in=TimelineEntry.objects.filter(user=user).values('recipe'))
+            | Q(author__in=Follow.objects.filter(
+                has_many_followers(OuterRef('author')), user=user
+            ).values('author'))
+        )
+
+    def for_read(self, user):
+        """Рецепты со всеми данными для ReadRecipeSerializer."""
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        ).with_user_flags(user).with_author_subscription(user)
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -105,34 +216,85 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Изображение для рецепта', upload_to='recipes/'
     )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+    popularity = models.FloatField(
+        'Популярность', default=0, editable=False,
+        help_text='Пересчитывается командой popularity.'
+    )
+    popularity_at = models.DateTimeField(
+        'Популярность пересчитана', blank=True, null=True, editable=False
+    )
+    similar_refreshed_at = models.DateTimeField(
+        'Похожие рецепты пересчитаны', blank=True, null=True, editable=False
+    )
 
     short_url = models.CharField(
         max_length=MAX_LENGTH_SHORT_URL,
         unique=True,
         db_index=True,
-        blank=True
+        blank=True,
+        null=True,
+        help_text='Код короткой ссылки для рецептов, созданных до '
+                  'перехода на коды из идентификатора.'
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-popularity', '-id'),
+                name='recipe_popularity_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_search_text = (
+            instance.__dict__.get('name'), instance.__dict__.get('text')
+        )
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.short_url:
-            today = datetime.today()
-            keys_for_short_url = [
-                round(today.timestamp() * 1000),
-                self.author.id,
-                self.cooking_time
-            ]
-            sqids = Sqids()
-            code = sqids.encode(keys_for_short_url)
-            self.short_url = code
-        return super(Recipe, self).save(*args, **kwargs)
+        super().save(*args, **kwargs)
+        self._saved_search_text = (self.name, self.text)
+
+    @property
+    def search_text_changed(self):
+        """Изменились ли название или описание с последнего сохранения."""
+        return getattr(self, '_saved_search_text', None) != (
+            self.name, self.text
+        )
+
+    @property
+    def short_code(self):
+        """Код короткой ссылки на рецепт."""
+        return self.short_url or encode_short_code(self.pk)
 
 
 class IngredientRecipe(models.Model):
@@ -157,6 +319,13 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиенты в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        indexes = (
+            models.Index(
+                fields=('recipe', 'ingredient'),
+                include=('amount',),
+                name='ingredientrecipe_recipe_idx'
+            ),
+        )
 
     def __str__(self):
         return self.ingredient
@@ -182,8 +351,20 @@ class TagRecipe(models.Model):
 
 class FavouritesAndShoppingList(models.Model):
 
+    # Счётчик рецепта, который меняется вместе со связью.
+    counter_field = None
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True
+    )
+    # Добавление учтено в популярности рецепта: каждое добавление
+    # прибавляется к оценке один раз, в каком бы порядке ни завершались
+    # транзакции.
+    popularity_counted = models.BooleanField(
+        'Учтено в популярности', default=False, editable=False
+    )
 
     class Meta:
         abstract = True
@@ -192,10 +373,18 @@ class FavouritesAndShoppingList(models.Model):
 class Favourites(FavouritesAndShoppingList):
     """Модель избранного."""
 
+    counter_field = 'favorites_count'
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
         default_related_name = 'favorites'
+        indexes = (
+            models.Index(
+                fields=('id',), name='favourites_uncounted_idx',
+                condition=Q(popularity_counted=False)
+            ),
+        )
         constraints = (
             UniqueConstraint(
                 fields=('user', 'recipe'),
@@ -219,10 +408,18 @@ class Favourites(FavouritesAndShoppingList):
 class ShoppingList(FavouritesAndShoppingList):
     """Список покупок."""
 
+    counter_field = 'in_carts_count'
+
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
         default_related_name = 'shopping_recipe'
+        indexes = (
+            models.Index(
+                fields=('id',), name='shoppinglist_uncounted_idx',
+                condition=Q(popularity_counted=False)
+            ),
+        )
         constraints = (
             UniqueConstraint(
                 fields=('user', 'recipe'),
@@ -241,3 +438,388 @@ class ShoppingList(FavouritesAndShoppingList):
             raise ValidationError({
                 'recipe': 'Рецепт уже в списке покупок.'
             })
+
+
+def change_counter(queryset, field, delta):
+    """Изменение счётчика через F() в текущей транзакции."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+# (модель, счётчик, модель-источник, ссылка источника на модель)
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (Recipe, 'favorites_count', Favourites, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+)
+
+
+def actual_count(source, link):
+    """Фактическое число строк источника для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        source.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def reconcile_counters(fix=True):
+    """Поиск и исправление расхождений счётчиков с данными.
+
+    Возвращает число строк с расхождением по каждому счётчику.
+    """
+    drift = {}
+    for model, field, source, link in COUNTERS:
+        drifted = model.objects.annotate(
+            actual=actual_count(source, link)
+        ).exclude(**{field: F('actual')}).values('pk')
+        if fix:
+            drift[field] = model.objects.filter(pk__in=drifted).update(
+                **{field: actual_count(source, link)}
+            )
+        else:
+            drift[field] = drifted.count()
+    return drift
+
+
+TIMELINE_BATCH_SIZE = 1000
+
+
+def delete_ranked_beyond(queryset, partition_by, order_by, limit):
+    """Удаление строк с номером больше limit в каждой группе одним
+    запросом.
+    """
+    ranked = queryset.annotate(
+        row_rank=Window(
+            RowNumber(), partition_by=F(partition_by), order_by=order_by
+        )
+    ).order_by().values('id', 'row_rank')
+    try:
+        sql, params = ranked.query.sql_with_params()
+    except EmptyResultSet:
+        # Фильтр по пустому списку: удалять нечего.
+        return
+    queryset.model.objects.filter(id__in=RawSQL(
+        f'SELECT id FROM ({sql}) ranked WHERE row_rank > %s',
+        (*params, limit)
+    )).delete()
+
+
+class TimelineQuerySet(models.QuerySet):
+    """Ленты подписок, которые заполняются при публикации рецептов."""
+
+    def _add(self, rows):
+        self.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id, pub_date=pub_date
+                )
+                for user_id, recipe_id, pub_date in rows
+            ),
+            batch_size=TIMELINE_BATCH_SIZE, ignore_conflicts=True
+        )
+
+    def trim(self, user_ids):
+        """Удаление записей сверх длины ленты.
+
+        Сначала одним запросом отбираются ленты длиннее предела: каждая
+        проверяется по индексу не дальше FEED_TIMELINE_LENGTH записей.
+        Записи нумеруются только в этих лентах, а не во всех лентах
+        подписчиков.
+        """
+        if not user_ids:
+            return
+        overflowing = list(User.objects.filter(
+            Exists(self.filter(user=OuterRef('pk')).order_by()[
+                settings.FEED_TIMELINE_LENGTH:
+            ]),
+            pk__in=user_ids
+        ).values_list('pk', flat=True))
+        if not overflowing:
+            return
+        delete_ranked_beyond(
+            self.filter(user_id__in=overflowing), 'user',
+            (F('pub_date').desc(), F('recipe').desc()),
+            settings.FEED_TIMELINE_LENGTH
+        )
+
+    def add_recipe(self, recipe):
+        """Раскладка нового рецепта по лентам подписчиков автора."""
+        followers = Follow.objects.filter(author=recipe.author_id)
+        if followers.order_by()[settings.FEED_FANOUT_MAX_FOLLOWERS:].exists():
+            return
+        user_ids = list(followers.values_list('user_id', flat=True))
+        if not user_ids:
+            return
+        self._add(
+            (user_id, recipe.id, recipe.pub_date) for user_id in user_ids
+        )
+        self.trim(user_ids)
+
+    def follow(self, user, author):
+        """Последние рецепты автора в ленте нового подписчика."""
+        if Follow.objects.filter(
+            author=author
+        ).order_by()[settings.FEED_FANOUT_MAX_FOLLOWERS:].exists():
+            return
+        self._add(
+            (user.id, recipe_id, pub_date)
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author=author
+            ).values_list('id', 'pub_date')[:settings.FEED_TIMELINE_LENGTH]
+        )
+        self.trim((user.id,))
+
+    def unfollow(self, user, author):
+        """Удаление рецептов автора из ленты бывшего подписчика."""
+        self.filter(user=user, recipe__author=author).delete()
+
+    def rebuild(self, user_ids=None):
+        """Полное построение лент по подпискам."""
+        rows = self.all()
+        follows = Follow.objects.exclude(
+            has_many_followers(OuterRef('author'))
+        )
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+            follows = follows.filter(user_id__in=user_ids)
+        rows.delete()
+        # Последние рецепты читаются по индексу (author, pub_date) отдельно
+        # для каждого подписчика, без соединения подписок со всеми
+        # рецептами плодовитых авторов.
+        for user_id in list(follows.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()):
+            self._add(
+                (user_id, recipe_id, pub_date)
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author__in=follows.filter(
+                        user_id=user_id
+                    ).values('author')
+                ).values_list(
+                    'id', 'pub_date'
+                )[:settings.FEED_TIMELINE_LENGTH]
+            )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_user_and_recipe_in_timeline',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте {self.user.username}'
+
+
+class SimilarRecipeQuerySet(models.QuerySet):
+    """Заранее посчитанные списки похожих рецептов."""
+
+    def trim(self, recipe_ids):
+        """Удаление соседей сверх SIMILAR_RECIPES_COUNT одним запросом."""
+        delete_ranked_beyond(
+            self.filter(recipe_id__in=recipe_ids), 'recipe',
+            (F('score').desc(), F('similar').desc()),
+            settings.SIMILAR_RECIPES_COUNT
+        )
+
+
+class SimilarRecipe(models.Model):
+    """Рецепт из списка похожих на другой рецепт."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_entries',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_for',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    objects = SimilarRecipeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_and_similar',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'), name='similar_recipe_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+CART_BATCH_SIZE = 500
+
+
+class ShoppingCartQuerySet(models.QuerySet):
+    """Изменение сводного списка покупок."""
+
+    def apply(self, user_ids, deltas):
+        """Прибавление количеств ингредиентов к спискам пользователей."""
+        deltas = [
+            (ingredient_id, delta)
+            for ingredient_id, delta in deltas.items() if delta
+        ]
+        if not user_ids:
+            return
+        for start in range(0, len(deltas), CART_BATCH_SIZE):
+            self._apply_batch(
+                user_ids, dict(deltas[start:start + CART_BATCH_SIZE])
+            )
+
+    def _apply_batch(self, user_ids, deltas):
+        self.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0
+                )
+                for user_id in user_ids
+                for ingredient_id, delta in deltas.items() if delta > 0
+            ),
+            ignore_conflicts=True
+        )
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        rows.update(amount=Greatest(
+            F('amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(delta))
+                    for ingredient_id, delta in deltas.items()
+                ),
+                default=Value(0),
+                output_field=models.IntegerField()
+            ),
+            Value(0)
+        ))
+        rows.filter(amount=0).delete()
+
+    def add_recipe(self, user, recipe):
+        """Добавление рецепта в список покупок пользователя."""
+        self.apply((user.id,), recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        """Удаление рецепта из списка покупок пользователя."""
+        self.apply((user.id,), {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipe_amounts(recipe).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Учёт изменения ингредиентов рецепта во всех списках покупок."""
+        user_ids = list(ShoppingList.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True))
+        self.apply(user_ids, {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        })
+
+    def expected(self, user_ids=None):
+        """Сводный список, посчитанный заново по рецептам в корзинах."""
+        rows = IngredientRecipe.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(recipe__shopping_recipe__user__in=user_ids)
+        return rows.filter(
+            recipe__shopping_recipe__isnull=False
+        ).values_list(
+            'recipe__shopping_recipe__user', 'ingredient'
+        ).order_by().annotate(total=Sum('amount'))
+
+    def rebuild(self, user_ids=None):
+        """Полный пересчёт сводного списка покупок."""
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows.delete()
+        self.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=total
+                )
+                for user_id, ingredient_id, total
+                in self.expected(user_ids).iterator()
+            ),
+            batch_size=1000
+        )
+
+
+def recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return dict(recipe.ingredient_list.values_list('ingredient_id', 'amount'))
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сводный список покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Общее количество')
+
+    objects = ShoppingCartQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_and_ingredient_in_cart',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount} у {self.user.username}'
@@ -0,0 +1,100 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from recipes.models import Favourites, Recipe, ShoppingList
+
+# Вклад добавления в момент t равен weight * 2 ** (-(now - t) / half_life).
+# Множитель 2 ** (-(now - EPOCH) / half_life) общий для всех рецептов
+# и на порядок не влияет, поэтому хранится
+# log2(1 + sum(weight * 2 ** ((t - EPOCH) / half_life))): значение
+# не устаревает, и пересчёт только прибавляет новые добавления.
+# Вычисления в логарифмах, чтобы степени двойки не переполняли float.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+SOURCES = ((Favourites, 'favorites'), (ShoppingList, 'carts'))
+UPDATE_BATCH_SIZE = 1000
+
+
+def log2_add(first, second):
+    """log2(2 ** first + 2 ** second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def event_score(created_at, weight):
+    """log2 вклада одного добавления."""
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60
+    return (
+        (created_at - EPOCH).total_seconds() / half_life + math.log2(weight)
+    )
+
+
+def collect(full):
+    """log2 суммы вкладов добавлений по рецептам.
+
+    Без full читаются только неучтённые добавления, они блокируются до
+    конца транзакции, чтобы параллельный пересчёт их пропустил.
+    Возвращает ещё идентификаторы неучтённых добавлений по моделям.
+    """
+    scores = defaultdict(lambda: -math.inf)
+    events = 0
+    uncounted = {}
+    for model, name in SOURCES:
+        weight = settings.POPULARITY_WEIGHTS[name]
+        rows = model.objects.all()
+        if not full:
+            rows = rows.filter(popularity_counted=False).select_for_update()
+        ids = uncounted[model] = []
+        for pk, recipe_id, created_at, counted in rows.values_list(
+            'id', 'recipe_id', 'created_at', 'popularity_counted'
+        ).iterator():
+            scores[recipe_id] = log2_add(
+                scores[recipe_id], event_score(created_at, weight)
+            )
+            events += 1
+            if not counted:
+                ids.append(pk)
+    return scores, events, uncounted
+
+
+def recompute(full=False):
+    """Пересчёт популярности, возвращает (добавлений, рецептов).
+
+    Без full учитываются только добавления, которые ещё не учтены.
+    Удаления из избранного и списков покупок учитывает только полный
+    пересчёт.
+    """
+    now = django_timezone.now()
+    with transaction.atomic():
+        scores, events, uncounted = collect(full)
+        if full:
+            Recipe.objects.update(popularity=0, popularity_at=now)
+            current = {}
+        else:
+            current = dict(Recipe.objects.filter(
+                id__in=scores
+            ).values_list('id', 'popularity'))
+        recipes = [
+            Recipe(
+                id=recipe_id,
+                popularity=log2_add(current.get(recipe_id, 0), score),
+                popularity_at=now,
+            )
+            for recipe_id, score in scores.items()
+        ]
+        Recipe.objects.bulk_update(
+            recipes, ('popularity', 'popularity_at'),
+            batch_size=UPDATE_BATCH_SIZE
+        )
+        # Отмечаются только прочитанные строки: добавления из транзакций,
+        # завершившихся после чтения, останутся для следующего пересчёта.
+        for model, ids in uncounted.items():
+            for position in range(0, len(ids), UPDATE_BATCH_SIZE):
+                model.objects.filter(
+                    id__in=ids[position:position + UPDATE_BATCH_SIZE]
+                ).update(popularity_counted=True)
+    return events, len(recipes)
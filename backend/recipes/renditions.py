@@ -0,0 +1,101 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+RENDITION_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+RENDITION_EXTENSION = {'WEBP': 'webp', 'JPEG': 'jpg'}[RENDITION_FORMAT]
+
+# модель: (поле изображения, размеры копий)
+RENDITION_FIELDS = {
+    Recipe: ('image', settings.RECIPE_IMAGE_RENDITIONS),
+    User: ('avatar', settings.AVATAR_RENDITIONS),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RENDITION_WORKERS, thread_name_prefix='renditions'
+)
+
+
+def rendition_name(name, size_name):
+    stem, _ = os.path.splitext(name)
+    return f'renditions/{stem}_{size_name}.{RENDITION_EXTENSION}'
+
+
+def render(name, sizes):
+    """Уменьшенные копии изображения: {имя размера: путь в хранилище}.
+
+    Копии одного исходного файла общие, поэтому уже готовые не пересчитываются.
+    """
+    renditions = {}
+    with default_storage.open(name, 'rb') as source, \
+            Image.open(source) as image:
+        if RENDITION_FORMAT == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for size_name, size in sizes.items():
+            path = rendition_name(name, size_name)
+            if not default_storage.exists(path):
+                copy = image.copy()
+                copy.thumbnail((size, size))
+                buffer = BytesIO()
+                copy.save(
+                    buffer, RENDITION_FORMAT,
+                    quality=settings.RENDITION_QUALITY
+                )
+                path = default_storage.save(path, ContentFile(
+                    buffer.getvalue()
+                ))
+            renditions[size_name] = path
+    return renditions
+
+
+def generate(model, pk):
+    """Построение копий изображения объекта и сохранение их путей."""
+    field_name, sizes = RENDITION_FIELDS[model]
+    name = model.objects.filter(pk=pk).values_list(
+        field_name, flat=True
+    ).first()
+    if not name:
+        return
+    try:
+        renditions = render(name, sizes)
+    except (OSError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось построить копии %s: %s', name, error)
+        renditions = {'error': str(error)}
+    # Если изображение успели заменить, копии запишет следующая задача.
+    model.objects.filter(pk=pk, **{field_name: name}).update(
+        **{f'{field_name}_renditions': renditions}
+    )
+
+
+def run(model, pk):
+    try:
+        generate(model, pk)
+    except Exception:
+        logger.exception('Ошибка построения копий %s %s', model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def schedule(instance):
+    """Постановка изображения в очередь после фиксации транзакции.
+
+    До готовности копий сериализаторы отдают оригинал.
+    """
+    model = type(instance)
+    transaction.on_commit(
+        lambda: executor.submit(run, model, instance.pk)
+    )
@@ -0,0 +1,338 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+from PIL import Image
+
+from recipes.models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartIngredient, ShoppingList, Tag,
+                            TimelineEntry, reconcile_counters)
+from recipes.popularity import recompute as recompute_popularity
+from recipes.similar import refresh as refresh_similar
+from users.models import Follow
+
+User = get_user_model()
+
+SAMPLE_IMAGE = 'recipes/sample.png'
+PLACEHOLDER_IMAGE = 'recipes/placeholder.jpg'
+GENERATED_START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+GENERATED_PERIOD = timedelta(days=4 * 365)
+# Слова для названий и описаний сгенерированных рецептов, чтобы поиск
+# находил разное число рецептов для разных слов.
+RECIPE_WORDS = (
+    'суп', 'салат', 'пирог', 'котлеты', 'каша', 'омлет', 'рагу', 'плов',
+    'блины', 'запеканка', 'борщ', 'курица', 'говядина', 'свинина', 'рыба',
+    'грибы', 'картофель', 'капуста', 'морковь', 'свекла', 'томаты', 'сыр',
+    'творог', 'яблоки', 'тыква', 'рис', 'гречка', 'фасоль', 'чечевица',
+    'лук', 'чеснок', 'укроп', 'сметана', 'сливки', 'мед', 'орехи', 'ягоды',
+    'шоколад', 'тесто', 'домашний', 'быстрый', 'постный', 'праздничный',
+    'деревенский', 'острый', 'сливочный', 'запеченный', 'тушеный',
+    'жареный', 'летний', 'зимний', 'нежный', 'пряный', 'сладкий',
+)
+
+
+@contextmanager
+def temporary_database():
+    """Временная тестовая база с кэшем TEST_CACHES для проверок и замеров."""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(CACHES=settings.TEST_CACHES):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def create_sample_data(users=4, recipes=12, tags=3, ingredients=10):
+    """Наполнение базы небольшим набором связанных данных."""
+    user_list = [
+        User.objects.create_user(
+            email=f'sample{number}@foodgram.ru',
+            username=f'sample{number}',
+            first_name='Имя',
+            last_name='Фамилия',
+            password='sample-password',
+        )
+        for number in range(users)
+    ]
+    tag_list = [
+        Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+        for number in range(tags)
+    ]
+    ingredient_list = [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        )
+        for number in range(ingredients)
+    ]
+    recipe_list = []
+    for number in range(recipes):
+        recipe = Recipe.objects.create(
+            author=user_list[number % users],
+            name=f'Рецепт {number}',
+            text='Описание рецепта',
+            cooking_time=number + 1,
+            image=SAMPLE_IMAGE,
+        )
+        recipe.tags.set(tag_list[:number % tags + 1])
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredient_list[
+                    (number + shift) % ingredients
+                ],
+                amount=shift + 1,
+            )
+            for shift in range(number % 5 + 1)
+        )
+        recipe_list.append(recipe)
+    reader = user_list[0]
+    Follow.objects.bulk_create(
+        Follow(user=reader, author=author) for author in user_list[1:-1]
+    )
+    Favourites.objects.bulk_create(
+        Favourites(user=reader, recipe=recipe)
+        for recipe in recipe_list[::2]
+    )
+    ShoppingList.objects.bulk_create(
+        ShoppingList(user=reader, recipe=recipe)
+        for recipe in recipe_list[::3]
+    )
+    ShoppingCartIngredient.objects.rebuild((reader.id,))
+    # bulk_create обходит счётчики и ленты, поэтому они пересчитываются.
+    reconcile_counters()
+    TimelineEntry.objects.rebuild()
+    recompute_popularity(full=True)
+    refresh_similar(full=True)
+    return {
+        'users': user_list,
+        'tags': tag_list,
+        'ingredients': ingredient_list,
+        'recipes': recipe_list,
+    }
+
+
+def power_law_weights(count, skew):
+    """Накопленные веса, при которых первые элементы встречаются чаще."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def pick_distinct(rng, population, cum_weights, count, exclude=None):
+    """До count разных элементов с учётом весов."""
+    chosen = set()
+    for _ in range(3):
+        for item in rng.choices(population, cum_weights=cum_weights, k=count):
+            if item != exclude:
+                chosen.add(item)
+        if len(chosen) >= count:
+            break
+    return list(chosen)[:count]
+
+
+def insert_batches(model, objects, batch_size):
+    """bulk_create из генератора частями, возвращает число строк."""
+    objects = iter(objects)
+    total = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return total
+        model.objects.bulk_create(batch, batch_size=batch_size)
+        total += len(batch)
+
+
+def new_ids(model, last_id):
+    return list(model.objects.filter(pk__gt=last_id).order_by(
+        'pk'
+    ).values_list('pk', flat=True))
+
+
+def last_id(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+@contextmanager
+def explicit_date(model, name):
+    """Отключение auto_now_add, чтобы строки получили заданные даты."""
+    field = model._meta.get_field(name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def write_placeholder_image():
+    if default_storage.exists(PLACEHOLDER_IMAGE):
+        return
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (230, 230, 230)).save(buffer, 'JPEG')
+    default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+
+
+def generate_data(users=1000, recipes=10000, tags=12, ingredients=2000,
+                  follows=10, favorites=20, carts=3, skew=1.1, seed=0,
+                  batch_size=10000, images=True, report=None,
+                  ingredients_per_recipe=(3, 12)):
+    """Наполнение базы данными, похожими на рабочие.
+
+    Авторы и рецепты выбираются по степенному закону: небольшая часть
+    пользователей пишет большинство рецептов и собирает большинство
+    подписок, избранного и покупок. При одинаковом seed данные совпадают.
+    Все рецепты ссылаются на одно изображение-заглушку, которое
+    записывается в хранилище, если images=True.
+    """
+    rng = random.Random(seed)
+    stats = {}
+
+    def phase(name, insert):
+        start = time.perf_counter()
+        with transaction.atomic():
+            stats[name] = insert()
+        if report is not None:
+            report(name, stats[name], time.perf_counter() - start)
+
+    if images:
+        write_placeholder_image()
+
+    start_user = last_id(User)
+    password = make_password('generated-password')
+    prefix = f'gen{seed}x{start_user}'
+    phase('users', lambda: insert_batches(User, (
+        User(
+            email=f'{prefix}n{number}@foodgram.ru',
+            username=f'{prefix}n{number}',
+            first_name='Имя', last_name='Фамилия', password=password,
+        )
+        for number in range(users)
+    ), batch_size))
+    user_ids = new_ids(User, start_user)
+
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+    if len(tag_ids) < tags:
+        start_tag = last_id(Tag)
+        phase('tags', lambda: insert_batches(Tag, (
+            Tag(name=f'{prefix}t{number}', slug=f'{prefix}t{number}')
+            for number in range(tags - len(tag_ids))
+        ), batch_size))
+        tag_ids += new_ids(Tag, start_tag)
+
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    if len(ingredient_ids) < ingredients:
+        start_ingredient = last_id(Ingredient)
+        phase('ingredients', lambda: insert_batches(Ingredient, (
+            Ingredient(name=f'Ингредиент {prefix}i{number}',
+                       measurement_unit=rng.choice(('г', 'мл', 'шт')))
+            for number in range(ingredients - len(ingredient_ids))
+        ), batch_size))
+        ingredient_ids += new_ids(Ingredient, start_ingredient)
+
+    author_weights = power_law_weights(len(user_ids), skew)
+    word_weights = power_law_weights(len(RECIPE_WORDS), skew)
+
+    def words(low, high):
+        return ' '.join(rng.choices(
+            RECIPE_WORDS, cum_weights=word_weights, k=rng.randint(low, high)
+        ))
+
+    start_recipe = last_id(Recipe)
+    with explicit_date(Recipe, 'pub_date'):
+        phase('recipes', lambda: insert_batches(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=f'{words(1, 3)} {number}'.capitalize(),
+                text=words(10, 30),
+                cooking_time=rng.randint(5, 180),
+                image=PLACEHOLDER_IMAGE,
+                pub_date=GENERATED_START + GENERATED_PERIOD * rng.random(),
+            )
+            for number, author_id in enumerate(rng.choices(
+                user_ids, cum_weights=author_weights, k=recipes
+            ))
+        ), batch_size))
+    recipe_ids = new_ids(Recipe, start_recipe)
+
+    tag_weights = power_law_weights(len(tag_ids), skew)
+    phase('recipe_tags', lambda: insert_batches(Recipe.tags.through, (
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in pick_distinct(
+            rng, tag_ids, tag_weights, rng.randint(1, 3)
+        )
+    ), batch_size))
+    ingredient_weights = power_law_weights(len(ingredient_ids), skew)
+    phase('recipe_ingredients', lambda: insert_batches(IngredientRecipe, (
+        IngredientRecipe(
+            recipe_id=recipe_id, ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500)
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in pick_distinct(
+            rng, ingredient_ids, ingredient_weights,
+            rng.randint(*ingredients_per_recipe)
+        )
+    ), batch_size))
+
+    # Популярность не должна совпадать с порядком публикации.
+    popular_recipes = recipe_ids[:]
+    rng.shuffle(popular_recipes)
+    recipe_weights = power_law_weights(len(popular_recipes), skew)
+    phase('follows', lambda: insert_batches(Follow, (
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in pick_distinct(
+            rng, user_ids, author_weights, rng.randint(0, 2 * follows),
+            exclude=user_id
+        )
+    ), batch_size))
+    for name, model, average in (
+        ('favorites', Favourites, favorites),
+        ('carts', ShoppingList, carts),
+    ):
+        with explicit_date(model, 'created_at'):
+            phase(name, lambda: insert_batches(model, (
+                model(
+                    user_id=user_id, recipe_id=recipe_id,
+                    created_at=(
+                        GENERATED_START + GENERATED_PERIOD * rng.random()
+                    ),
+                )
+                for user_id in user_ids
+                for recipe_id in pick_distinct(
+                    rng, popular_recipes, recipe_weights,
+                    rng.randint(0, 2 * average)
+                )
+            ), batch_size))
+
+    def rebuild_carts():
+        ShoppingCartIngredient.objects.rebuild()
+        return ShoppingCartIngredient.objects.count()
+
+    phase('cart_ingredients', rebuild_carts)
+    phase('counters', lambda: sum(reconcile_counters().values()))
+
+    def rebuild_timelines():
+        TimelineEntry.objects.rebuild()
+        return TimelineEntry.objects.count()
+
+    phase('timelines', rebuild_timelines)
+    phase('popularity', lambda: recompute_popularity(full=True)[1])
+    phase('similar', lambda: refresh_similar(full=True))
+    stats['user_ids'] = user_ids
+    stats['recipe_ids'] = recipe_ids
+    return stats
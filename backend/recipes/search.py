@@ -0,0 +1,353 @@
+import heapq
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from recipes.catalog import get_catalog_version, new_version
+from recipes.models import Ingredient, Recipe
+
+RECIPE_SEARCH_VERSION_KEY = 'recipes:search:version'
+SEARCH_CONFIG = 'russian'
+# Веса названия и описания, как у весов A и B в ts_rank.
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+WORD_RE = re.compile(r'\w+')
+# Окончания для упрощённого стемминга, длинные проверяются первыми.
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях',
+    'ией', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую',
+    'юю', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ть', 'а', 'я',
+    'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+# Остальные слова запроса индекс в памяти не учитывает.
+MAX_QUERY_TERMS = 8
+# Цена разбора одного сочетания весов на каждое слово запроса в пересчёте
+# на просмотренные идентификаторы: сумма весов и соседние сочетания
+# в очереди обходятся примерно как столько проверок по множеству.
+COMBINATION_COST = 32
+
+
+def normalize(text):
+    """Приведение строки к виду для поиска без учёта регистра."""
+    return text.casefold().replace('ё', 'е')
+
+
+def stem(word):
+    """Основа слова: отбрасывается самое длинное русское окончание."""
+    for ending in RUSSIAN_ENDINGS:
+        if (
+            word.endswith(ending)
+            and len(word) - len(ending) >= MIN_STEM_LENGTH
+        ):
+            return word[:-len(ending)]
+    return word
+
+
+def terms(text, stems=None):
+    """Основы слов текста. stems кэширует уже обработанные слова."""
+    if stems is None:
+        stems = {}
+    result = []
+    for word in WORD_RE.findall(normalize(text)):
+        term = stems.get(word)
+        if term is None:
+            term = stems[word] = stem(word)
+        result.append(term)
+    return result
+
+
+def get_recipe_search_version():
+    version = cache.get(RECIPE_SEARCH_VERSION_KEY)
+    if version is None:
+        cache.add(RECIPE_SEARCH_VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(RECIPE_SEARCH_VERSION_KEY)
+    return version
+
+
+def bump_recipe_search_version():
+    """Новая версия индекса рецептов после изменения рецепта."""
+    cache.set(RECIPE_SEARCH_VERSION_KEY, new_version(), timeout=None)
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по префиксу.
+
+    Индекс перестраивается, когда меняется версия справочников.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def _build(self):
+        entries = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        return [entry[0] for entry in entries], entries
+
+    def _get(self):
+        version, _ = get_catalog_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._data = self._build()
+                    self._version = version
+        return self._data
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        keys, entries = self._get()
+        query = normalize(query.strip())
+        found = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys) and keys[position].startswith(query)
+            and len(found) < limit
+        ):
+            found.append(entries[position])
+            position += 1
+        if query:
+            for entry in entries:
+                if len(found) >= limit:
+                    break
+                if query in entry[0] and not entry[0].startswith(query):
+                    found.append(entry)
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientIndex()
+
+
+class RecipeIndex:
+    """Обратный индекс рецептов в памяти процесса.
+
+    Используется вместо полнотекстового поиска PostgreSQL в остальных
+    базах. Для каждой основы идентификаторы рецептов разложены по весу
+    вхождения в отсортированные массивы. Индекс перестраивается, когда
+    меняется версия рецептов; пока он строится, другие потоки ищут
+    по прежнему индексу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = None
+
+    def _build(self):
+        postings = {}
+        stems = {}
+        for pk, name, text in Recipe.objects.order_by('pk').values_list(
+            'pk', 'name', 'text'
+        ).iterator():
+            weights = {}
+            for weight, field in ((NAME_WEIGHT, name), (TEXT_WEIGHT, text)):
+                for term in terms(field, stems):
+                    weights[term] = weights.get(term, 0) + weight
+            for term, weight in weights.items():
+                buckets = postings.setdefault(term, {})
+                key = round(weight, 1)
+                if key not in buckets:
+                    buckets[key] = array('q')
+                buckets[key].append(pk)
+        return {
+            term: sorted(buckets.items(), reverse=True)
+            for term, buckets in postings.items()
+        }
+
+    def _get(self):
+        version = get_recipe_search_version()
+        # Ждать построения приходится только самому первому запросу.
+        if self._version != version and self._lock.acquire(
+            blocking=self._postings is None
+        ):
+            try:
+                if self._version != version:
+                    self._postings = self._build()
+                    self._version = version
+            finally:
+                self._lock.release()
+        return self._postings
+
+    def search(self, query, limit, candidates=None):
+        """До limit рецептов со всеми словами запроса: {id: ранг}.
+
+        Среди рецептов с одинаковым рангом выбираются более новые.
+        Учитываются первые MAX_QUERY_TERMS различных слов запроса.
+        Если задано множество candidates, рецепты выбираются только из него.
+        """
+        postings = self._get()
+        term_buckets = [
+            postings.get(term, ())
+            for term in list(dict.fromkeys(terms(query)))[:MAX_QUERY_TERMS]
+        ]
+        if candidates is not None:
+            term_buckets = [
+                [
+                    (weight, array('q', sorted(candidates.intersection(ids))))
+                    for weight, ids in buckets
+                    if not candidates.isdisjoint(ids)
+                ]
+                for buckets in term_buckets
+            ]
+        if not term_buckets or not all(term_buckets):
+            return {}
+        found = self._search_by_weights(term_buckets, limit)
+        if found is None:
+            found = self._search_all(term_buckets, limit)
+        return {pk: rank for rank, pk in found}
+
+    @staticmethod
+    def _search_by_weights(term_buckets, limit):
+        """Перебор сочетаний весов слов по убыванию суммы.
+
+        Частые слова набирают limit рецептов за несколько первых
+        сочетаний. Если перебор просмотрел больше идентификаторов, чем
+        всего есть у слов запроса, возвращается None: полное пересечение
+        обойдётся дешевле.
+        """
+        # Ранг округляется, чтобы равные суммы весов совпадали точно.
+        def rank(indexes):
+            return round(sum(
+                buckets[index][0]
+                for buckets, index in zip(term_buckets, indexes)
+            ), 1)
+
+        start = (0,) * len(term_buckets)
+        queue = [(-rank(start), start)]
+        seen = {start}
+        found = []
+        sets = {}
+        budget = sum(
+            len(ids) for buckets in term_buckets for _, ids in buckets
+        )
+        while budget > 0:
+            combination_rank, indexes = heapq.heappop(queue)
+            combination_rank = -combination_rank
+            budget -= COMBINATION_COST * len(indexes)
+            arrays = sorted(
+                (
+                    buckets[index][1]
+                    for buckets, index in zip(term_buckets, indexes)
+                ),
+                key=len
+            )
+            if len(arrays) == 1:
+                ids = arrays[0][-limit:]
+                budget -= len(ids)
+            else:
+                ids = set(arrays[0])
+                budget -= len(ids)
+                for other in arrays[1:]:
+                    if id(other) not in sets:
+                        sets[id(other)] = set(other)
+                        budget -= len(other)
+                    ids &= sets[id(other)]
+                    if not ids:
+                        break
+            found.extend((combination_rank, pk) for pk in ids)
+            for term, index in enumerate(indexes):
+                if index + 1 < len(term_buckets[term]):
+                    following = (
+                        indexes[:term] + (index + 1,) + indexes[term + 1:]
+                    )
+                    if following not in seen:
+                        seen.add(following)
+                        heapq.heappush(
+                            queue, (-rank(following), following)
+                        )
+            if not queue or (
+                len(found) >= limit and -queue[0][0] < combination_rank
+            ):
+                return heapq.nlargest(limit, found)
+        return None
+
+    @staticmethod
+    def _search_all(term_buckets, limit):
+        """Пересечение всех рецептов слов и limit лучших по сумме весов.
+
+        Время растёт с числом рецептов слов, а не с числом сочетаний.
+        """
+        # Пересечение начинается с самого редкого слова, поэтому проверки
+        # принадлежности идут по уже небольшому множеству.
+        term_buckets = sorted(term_buckets, key=lambda buckets: sum(
+            len(ids) for _, ids in buckets
+        ))
+        found = set()
+        for _, ids in term_buckets[0]:
+            found.update(ids)
+        for buckets in term_buckets[1:]:
+            found = set().union(*(
+                found.intersection(ids) for _, ids in buckets
+            ))
+            if not found:
+                return []
+        ranks = dict.fromkeys(found, 0.0)
+        for buckets in term_buckets:
+            for weight, ids in buckets:
+                for pk in found.intersection(ids):
+                    ranks[pk] += weight
+        return heapq.nlargest(
+            limit, ((round(rank, 1), pk) for pk, rank in ranks.items())
+        )
+
+
+recipe_index = RecipeIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты, найденные по названию и описанию, с рангом search_rank.
+
+    Порядок выдачи не меняется: сортировку по рангу выбирает вызывающий.
+    В PostgreSQL используется столбец search_vector с индексом GIN,
+    в остальных базах — индекс в памяти процесса, который возвращает
+    не больше RECIPE_SEARCH_FALLBACK_LIMIT лучших рецептов из queryset.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        table = Recipe._meta.db_table
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = queryset.filter(RawSQL(
+            f'"{table}"."search_vector" @@ {tsquery}', (query,),
+            output_field=models.BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank("{table}"."search_vector", {tsquery})', (query,),
+            output_field=FloatField()
+        ))
+    else:
+        # Если рецепты уже отфильтрованы, лимит применяется к ним,
+        # а не ко всем рецептам с подходящими словами.
+        candidates = None
+        if queryset.query.where:
+            candidates = set(
+                queryset.order_by().values_list('id', flat=True)
+            )
+        ranks = recipe_index.search(
+            query, settings.RECIPE_SEARCH_FALLBACK_LIMIT, candidates
+        )
+        # Различных рангов немного: они складываются из весов слов.
+        by_rank = {}
+        for pk, rank in ranks.items():
+            by_rank.setdefault(rank, []).append(pk)
+        queryset = queryset.filter(id__in=ranks).annotate(search_rank=Case(
+            *(
+                When(id__in=ids, then=Value(rank))
+                for rank, ids in by_rank.items()
+            ),
+            default=Value(0.0),
+            output_field=FloatField()
+        ))
+    return queryset
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.catalog import bump_catalog_version
+from recipes.models import (Ingredient, Recipe, ShoppingCartIngredient, Tag,
+                            recipe_amounts)
+from recipes.search import bump_recipe_search_version
+from recipes.views import get_recipe_id
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def change_catalog_version(**kwargs):
+    """Смена версии справочников при изменении тегов и ингредиентов."""
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Recipe)
+def change_recipe_search_version(instance, **kwargs):
+    """Смена версии индекса поиска рецептов в памяти процесса.
+
+    Сохранение без правки названия и описания индекс не меняет.
+    """
+    if instance.search_text_changed:
+        transaction.on_commit(bump_recipe_search_version)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_recipe_search(**kwargs):
+    """Смена версии индекса поиска после удаления рецепта."""
+    transaction.on_commit(bump_recipe_search_version)
+
+
+@receiver(post_delete, sender=Recipe)
+def clear_short_links(**kwargs):
+    """Сброс кэша коротких ссылок после удаления рецепта."""
+    get_recipe_id.cache_clear()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_carts(instance, **kwargs):
+    """Вычитание ингредиентов удаляемого рецепта из списков покупок.
+
+    Срабатывает при любом удалении: через api, в админке и вместе
+    с автором.
+    """
+    ShoppingCartIngredient.objects.change_recipe(
+        instance, recipe_amounts(instance), {}
+    )
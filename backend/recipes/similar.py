@@ -0,0 +1,199 @@
+import heapq
+import math
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import IngredientRecipe, Recipe, SimilarRecipe
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Без numpy и scipy соседи считаются на чистом Python.
+    np = sparse = None
+
+BLOCK_SIZE = 1000
+INSERT_BATCH_SIZE = 5000
+# Сходство рецептов a и b — косинус между векторами ингредиентов, где
+# вес ингредиента равен idf = log(N / df): общие редкие ингредиенты
+# значат больше. Ингредиенты, которые есть больше чем в доле
+# SIMILAR_MAX_DF_SHARE рецептов (соль, вода), не учитываются: вес у них
+# и так мал, а перебор их рецептов занимает большую часть расчёта.
+# В маленьком каталоге доля набирается парой рецептов, поэтому порог
+# не опускается ниже COMMON_MIN_RECIPES.
+COMMON_MIN_RECIPES = 100
+
+
+def chunks(ids, size=INSERT_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def max_df(total):
+    """Наибольшее число рецептов, в которых учитывается ингредиент."""
+    return max(settings.SIMILAR_MAX_DF_SHARE * total, COMMON_MIN_RECIPES)
+
+
+def load_pairs():
+    """Пары (рецепт, ингредиент) в компактных массивах."""
+    recipe_ids, ingredient_ids = array('q'), array('q')
+    for recipe_id, ingredient_id in IngredientRecipe.objects.order_by(
+    ).values_list('recipe_id', 'ingredient_id').iterator():
+        recipe_ids.append(recipe_id)
+        ingredient_ids.append(ingredient_id)
+    return recipe_ids, ingredient_ids
+
+
+def neighbours_python(recipe_ids, ingredient_ids, targets, count):
+    by_recipe = defaultdict(list)
+    postings = defaultdict(list)
+    for recipe_id, ingredient_id in zip(recipe_ids, ingredient_ids):
+        by_recipe[recipe_id].append(ingredient_id)
+        postings[ingredient_id].append(recipe_id)
+    total = len(by_recipe)
+    limit = max_df(total)
+    weights = {
+        ingredient_id: (
+            math.log(total / len(recipes)) ** 2
+            if len(recipes) <= limit else 0
+        )
+        for ingredient_id, recipes in postings.items()
+    }
+    norms = {
+        recipe_id: math.sqrt(sum(weights[i] for i in ingredients))
+        for recipe_id, ingredients in by_recipe.items()
+    }
+    result = {}
+    for target in targets:
+        scores = defaultdict(float)
+        for ingredient_id in by_recipe.get(target, ()):
+            weight = weights[ingredient_id]
+            if weight:
+                for recipe_id in postings[ingredient_id]:
+                    scores[recipe_id] += weight
+        scores.pop(target, None)
+        norm = norms.get(target)
+        result[target] = [
+            (score, recipe_id) for score, recipe_id in heapq.nlargest(
+                count,
+                (
+                    (score / (norm * norms[recipe_id]), recipe_id)
+                    for recipe_id, score in scores.items()
+                )
+            )
+        ]
+    return result
+
+
+def neighbours_numpy(recipe_ids, ingredient_ids, targets, count):
+    rows = np.frombuffer(recipe_ids, dtype=np.int64)
+    columns = np.frombuffer(ingredient_ids, dtype=np.int64)
+    if not len(rows):
+        return {target: [] for target in targets}
+    recipes, row_index = np.unique(rows, return_inverse=True)
+    _, column_index = np.unique(columns, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (row_index, column_index))
+    )
+    matrix.data[:] = 1
+    df = np.bincount(column_index)
+    idf = np.log(len(recipes) / df)
+    idf[df > max_df(len(recipes))] = 0
+    matrix = matrix.multiply(idf[np.newaxis, :]).tocsr()
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(
+        1, norms, out=np.zeros_like(norms), where=norms > 0
+    )
+    matrix = (sparse.diags(inverse) @ matrix).tocsr()
+    transposed = matrix.T.tocsr()
+    targets = np.asarray(list(targets), dtype=np.int64)
+    positions = np.searchsorted(recipes, targets)
+    known = (positions < len(recipes)) & (
+        recipes[np.minimum(positions, len(recipes) - 1)] == targets
+    )
+    result = {int(target): [] for target in targets[~known]}
+    target_rows = positions[known]
+    for start in range(0, len(target_rows), BLOCK_SIZE):
+        block = target_rows[start:start + BLOCK_SIZE]
+        scores = (matrix[block] @ transposed).tocsr()
+        for offset, row in enumerate(block):
+            low, high = scores.indptr[offset], scores.indptr[offset + 1]
+            similar = scores.indices[low:high]
+            values = scores.data[low:high]
+            keep = (similar != row) & (values > 0)
+            similar, values = similar[keep], values[keep]
+            if len(values) > count:
+                top = np.argpartition(-values, count)[:count]
+                similar, values = similar[top], values[top]
+            order = np.lexsort((-recipes[similar], -values))
+            result[int(recipes[row])] = [
+                (float(values[index]), int(recipes[similar[index]]))
+                for index in order
+            ]
+    return result
+
+
+def neighbours(targets, count, use_numpy=None):
+    """Самые похожие рецепты для targets: {id: [(сходство, id), ...]}."""
+    if use_numpy is None:
+        use_numpy = np is not None
+    find = neighbours_numpy if use_numpy else neighbours_python
+    return find(*load_pairs(), targets, count)
+
+
+def refresh(full=False, use_numpy=None):
+    """Пересчёт списков похожих рецептов, возвращает число рецептов.
+
+    Без full пересчитываются рецепты, у которых после прошлого запуска
+    менялся состав (similar_refreshed_at пуст), и они добавляются в
+    списки своих соседей. Полный пересчёт учитывает и изменение весов
+    ингредиентов, его стоит запускать реже.
+    """
+    count = settings.SIMILAR_RECIPES_COUNT
+    now = timezone.now()
+    recipes = Recipe.objects.all()
+    if not full:
+        recipes = recipes.filter(similar_refreshed_at__isnull=True)
+    targets = list(recipes.values_list('id', flat=True))
+    if not targets:
+        return 0
+    found = neighbours(targets, count, use_numpy)
+    with transaction.atomic():
+        if full:
+            SimilarRecipe.objects.all().delete()
+        else:
+            for ids in chunks(targets):
+                SimilarRecipe.objects.filter(recipe_id__in=ids).delete()
+                SimilarRecipe.objects.filter(similar_id__in=ids).delete()
+        rows = {
+            (recipe_id, similar_id): score
+            for recipe_id, similar in found.items()
+            for score, similar_id in similar
+        }
+        if not full:
+            # Сходство симметрично: рецепт попадает в списки своих соседей,
+            # лишнее затем отсекается.
+            for (recipe_id, similar_id), score in list(rows.items()):
+                rows.setdefault((similar_id, recipe_id), score)
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score
+                )
+                for (recipe_id, similar_id), score in rows.items()
+            ),
+            batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True
+        )
+        if not full:
+            for ids in chunks({recipe_id for recipe_id, _ in rows}):
+                SimilarRecipe.objects.trim(ids)
+        for ids in chunks(targets):
+            Recipe.objects.filter(id__in=ids).update(
+                similar_refreshed_at=now
+            )
+    return len(targets)
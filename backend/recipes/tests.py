@@ -0,0 +1,239 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Favourites, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartIngredient, ShoppingList,
+                            TimelineEntry)
+from recipes.popularity import recompute
+from recipes.sample_data import SAMPLE_IMAGE
+from recipes.search import get_recipe_search_version
+from users.models import Follow
+
+User = get_user_model()
+
+
+class PopularityRecomputeTests(TestCase):
+    """Инкрементальный пересчёт популярности учитывает добавление один раз."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@foodgram.ru', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия', password='password'
+            )
+            for number in range(3)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.users[0], name='Рецепт', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+
+    def popularity(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.popularity
+
+    def test_incremental_matches_full(self):
+        Favourites.objects.create(user=self.users[0], recipe=self.recipe)
+        recompute()
+        ShoppingList.objects.create(user=self.users[1], recipe=self.recipe)
+        self.assertEqual(recompute(), (1, 1))
+        incremental = self.popularity()
+        recompute(full=True)
+        self.assertAlmostEqual(incremental, self.popularity())
+
+    def test_event_committed_after_recompute_counted(self):
+        Favourites.objects.create(user=self.users[0], recipe=self.recipe)
+        recompute()
+        # Транзакция началась до пересчёта, а завершилась после него.
+        late = Favourites.objects.create(
+            user=self.users[1], recipe=self.recipe
+        )
+        Favourites.objects.filter(pk=late.pk).update(
+            created_at=late.created_at - timedelta(minutes=5)
+        )
+        self.assertEqual(recompute(), (1, 1))
+        incremental = self.popularity()
+        recompute(full=True)
+        self.assertAlmostEqual(incremental, self.popularity())
+
+    def test_repeated_recompute_adds_nothing(self):
+        Favourites.objects.create(user=self.users[2], recipe=self.recipe)
+        recompute()
+        popularity = self.popularity()
+        self.assertEqual(recompute(), (0, 0))
+        self.assertEqual(self.popularity(), popularity)
+
+
+class RecipeSearchVersionTests(TestCase):
+    """Индекс поиска перестраивается только после правки текста рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия', password='password'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+
+    def save_changes_version(self, **fields):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        for name, value in fields.items():
+            setattr(recipe, name, value)
+        version = get_recipe_search_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        return get_recipe_search_version() != version
+
+    def test_other_fields_keep_version(self):
+        self.assertFalse(self.save_changes_version(cooking_time=5))
+
+    def test_text_changes_version(self):
+        self.assertTrue(self.save_changes_version(text='Новое описание'))
+
+    def test_new_recipe_changes_version(self):
+        version = get_recipe_search_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                author=self.recipe.author, name='Суп', text='Описание',
+                cooking_time=1, image=SAMPLE_IMAGE
+            )
+        self.assertNotEqual(get_recipe_search_version(), version)
+
+
+class ShoppingCartTests(TestCase):
+    """Сводный список покупок совпадает с рецептами в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer = (
+            User.objects.create_user(
+                email=f'{username}@foodgram.ru', username=username,
+                first_name='Имя', last_name='Фамилия', password='password'
+            )
+            for username in ('cook', 'buyer')
+        )
+        cls.flour, cls.milk, cls.salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Молоко', 'Соль')
+        )
+        cls.pancakes = cls.create_recipe({cls.flour: 10, cls.milk: 5})
+        cls.bread = cls.create_recipe({cls.flour: 20})
+
+    @classmethod
+    def create_recipe(cls, amounts):
+        recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def add(self, recipe):
+        ShoppingList.objects.create(user=self.buyer, recipe=recipe)
+        ShoppingCartIngredient.objects.add_recipe(self.buyer, recipe)
+
+    def assertCart(self, amounts):
+        cart = dict(ShoppingCartIngredient.objects.filter(
+            user=self.buyer
+        ).values_list('ingredient_id', 'amount'))
+        self.assertEqual(cart, {
+            ingredient.pk: amount for ingredient, amount in amounts.items()
+        })
+        self.assertEqual(cart, {
+            ingredient_id: total
+            for _, ingredient_id, total
+            in ShoppingCartIngredient.objects.expected((self.buyer.pk,))
+        })
+
+    def test_add_and_remove(self):
+        self.add(self.pancakes)
+        self.add(self.bread)
+        self.assertCart({self.flour: 30, self.milk: 5})
+        ShoppingList.objects.filter(recipe=self.pancakes).delete()
+        ShoppingCartIngredient.objects.remove_recipe(
+            self.buyer, self.pancakes
+        )
+        self.assertCart({self.flour: 20})
+
+    def test_ingredients_changed(self):
+        self.add(self.pancakes)
+        IngredientRecipe.objects.filter(
+            recipe=self.pancakes, ingredient=self.milk
+        ).delete()
+        IngredientRecipe.objects.filter(
+            recipe=self.pancakes, ingredient=self.flour
+        ).update(amount=15)
+        IngredientRecipe.objects.create(
+            recipe=self.pancakes, ingredient=self.salt, amount=2
+        )
+        ShoppingCartIngredient.objects.change_recipe(
+            self.pancakes, {self.flour.pk: 10, self.milk.pk: 5},
+            {self.flour.pk: 15, self.salt.pk: 2}
+        )
+        self.assertCart({self.flour: 15, self.salt: 2})
+
+    def test_recipe_deleted(self):
+        # Удаление модели, как в админке, без кода api.
+        self.add(self.pancakes)
+        self.add(self.bread)
+        self.pancakes.delete()
+        self.assertCart({self.flour: 20})
+
+    def test_author_deleted(self):
+        self.add(self.pancakes)
+        self.add(self.bread)
+        self.author.delete()
+        self.assertCart({})
+
+
+@override_settings(FEED_TIMELINE_LENGTH=2)
+class TimelineTrimTests(TestCase):
+    """Ленты обрезаются до FEED_TIMELINE_LENGTH только при переполнении."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                email=f'{username}@foodgram.ru', username=username,
+                first_name='Имя', last_name='Фамилия', password='password'
+            )
+            for username in ('cook', 'reader')
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def publish(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=1, image=SAMPLE_IMAGE
+        )
+        with CaptureQueriesContext(connection) as context:
+            TimelineEntry.objects.add_recipe(recipe)
+        ranked = any('ROW_NUMBER' in query['sql'] for query in context)
+        return recipe, ranked
+
+    def test_only_overflowing_timelines_ranked(self):
+        first, first_ranked = self.publish()
+        second, second_ranked = self.publish()
+        third, third_ranked = self.publish()
+        self.assertEqual(
+            (first_ranked, second_ranked, third_ranked), (False, False, True)
+        )
+        self.assertCountEqual(
+            TimelineEntry.objects.filter(
+                user=self.reader
+            ).values_list('recipe', flat=True),
+            (second.pk, third.pk)
+        )
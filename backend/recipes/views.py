@@ -1,10 +1,38 @@
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from functools import lru_cache
 
-from recipes.models import Recipe
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
+
+from api.middleware import database_sync_to_async
+from recipes.models import Recipe, decode_short_code
+
+
+@lru_cache(maxsize=settings.SHORT_LINK_CACHE_SIZE)
+def get_recipe_id(short_url):
+    """Идентификатор рецепта по коду короткой ссылки.
+
+    Кэшируются только найденные рецепты: для отсутствующих
+    выбрасывается исключение, которое lru_cache не запоминает.
+    """
+    recipe_id = decode_short_code(short_url)
+    recipes = Recipe.objects.all()
+    if recipe_id is None:
+        recipes = recipes.filter(short_url=short_url)
+    else:
+        recipes = recipes.filter(pk=recipe_id)
+    recipe_id = recipes.values_list('pk', flat=True).first()
+    if recipe_id is None:
+        raise Http404('Рецепт не найден.')
+    return recipe_id
 
 
 def redirect_to_full_recipe(request, short_url):
-    recipe = get_object_or_404(Recipe, short_url=short_url)
-    full_url = f'/recipes/{recipe.id}'
+    full_url = f'/recipes/{get_recipe_id(short_url)}'
+    return HttpResponseRedirect(full_url)
+
+
+async def async_redirect_to_full_recipe(request, short_url):
+    """Переход по короткой ссылке в ASGI-приложении."""
+    recipe_id = await database_sync_to_async(get_recipe_id)(short_url)
+    full_url = f'/recipes/{recipe_id}'
     return HttpResponseRedirect(full_url)
@@ -14,7 +14,7 @@ admin.site.unregister(Group)
 class FoodgramUserAdmin(admin.ModelAdmin):
     """Создание объекта пользователя в админ панели."""
     list_display = (
-        'username', 'email', 'first_name', 'last_name'
+        'username', 'email', 'first_name', 'last_name', 'recipes_count'
     )
     list_filter = ('email', 'username')
     search_fields = ('email', 'username')
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_follow_user_is_not_author'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='follow',
+            name='unique_following',
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_following'),
+        ),
+    ]
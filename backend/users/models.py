@@ -36,6 +36,15 @@ class FoodgramUser(AbstractUser):
         null=True,
         default=DEFAULT_AVATAR
     )
+    avatar_renditions = models.JSONField(
+        'Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -76,7 +85,7 @@ class Follow(models.Model):
         ordering = ('user__username',)
         constraints = (
             UniqueConstraint(
-                fields=('author', 'user'), name='unique_following',
+                fields=('user', 'author'), name='unique_following',
             ),
             CheckConstraint(
                 check=~models.Q(user=models.F('author')),